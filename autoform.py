@@ -77,6 +77,8 @@ class AutoForm(STLView):
     description = None
     method = 'post'
     actions = [Button(access=True, css='button-ok', title=MSG(u'Save'))]
+    # Forms may include per-request content (captcha, etc.)
+    page_cache = False
 
     def get_widgets(self, resource, context):
         return self.widgets
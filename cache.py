@@ -0,0 +1,289 @@
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2012 Sylvain Taverne <sylvain@itaapy.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from collections import OrderedDict
+from hashlib import sha1
+from os import fdopen, listdir, makedirs, remove, rename, stat, utime
+from os.path import exists, isdir
+from tempfile import mkstemp
+from time import time
+
+
+"""This module defines the caches: a persistent cache, stored in the
+filesystem, and a cache of full pages, kept in memory.  In both the values
+are evicted in LRU order once the cache reaches its maximum size.
+"""
+
+
+def get_blob_id(data):
+    """Return the sha1 Git uses to identify the given data.
+    """
+    return sha1('blob %d\0%s' % (len(data), data)).hexdigest()
+
+
+
+class DiskCache(object):
+    """Every value is stored in its own file, named after the sha1 of its
+    key.  The size is the sum of the size of the values, in bytes.
+
+    The folder may be shared by several processes (the server, the index
+    workers, the replicas), so it is the reference: the size is computed
+    again from the folder (see 'make_room') when this process finds the
+    cache full, or when it has written a tenth of the size since the last
+    time.  The modification time of the files gives the LRU order.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        # Stats (of this process)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # The size, as of the last scan plus what was written since
+        if not isdir(path):
+            makedirs(path)
+        self.total = 0
+        self.written = 0
+        self.make_room()
+
+
+    def _get_path(self, name):
+        return '%s/%s/%s' % (self.path, name[:2], name)
+
+
+    def _touch(self, path):
+        now = time()
+        try:
+            utime(path, (now, now))
+        except OSError:
+            # Removed by another process
+            pass
+
+
+    def get(self, key):
+        """Return the value for the given key, or None if it is not in the
+        cache.
+        """
+        path = self._get_path(sha1(key).hexdigest())
+        try:
+            file = open(path)
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            value = file.read()
+        finally:
+            file.close()
+
+        # Mark as recently used
+        self._touch(path)
+        self.hits += 1
+        return value
+
+
+    def set(self, key, value):
+        name = sha1(key).hexdigest()
+        size = len(value)
+        if size > self.size:
+            return
+
+        # Write to a temporary file first, then rename (atomic)
+        folder = '%s/%s' % (self.path, name[:2])
+        if not exists(folder):
+            makedirs(folder)
+        fd, tmp_path = mkstemp(prefix='.', dir=folder)
+        file = fdopen(fd, 'w')
+        try:
+            file.write(value)
+        finally:
+            file.close()
+        path = self._get_path(name)
+        rename(tmp_path, path)
+        self._touch(path)
+
+        # Check the size
+        self.total += size
+        self.written += size
+        if self.total > self.size or self.written * 10 > self.size:
+            self.make_room()
+
+
+    def scan(self):
+        """Return the list of tuples (mtime, path, size) of the values in
+        the folder, least recently used first.
+        """
+        entries = []
+        for prefix in listdir(self.path):
+            folder = '%s/%s' % (self.path, prefix)
+            for name in listdir(folder):
+                # Skip temporary files
+                if name[0] == '.':
+                    continue
+                path = '%s/%s' % (folder, name)
+                try:
+                    st = stat(path)
+                except OSError:
+                    # Removed by another process
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+        entries.sort()
+        return entries
+
+
+    def make_room(self):
+        """Compute the size from the folder, and remove the least recently
+        used values until it fits.
+        """
+        entries = self.scan()
+        total = sum([ size for mtime, path, size in entries ])
+        for mtime, path, size in entries:
+            if total <= self.size:
+                break
+            total -= size
+            try:
+                remove(path)
+            except OSError:
+                # Removed by another process
+                continue
+            self.evictions += 1
+
+        self.total = total
+        self.written = 0
+
+
+    def get_stats(self):
+        entries = self.scan()
+        return {
+            'entries': len(entries),
+            'size': sum([ size for mtime, path, size in entries ]),
+            'max-size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions}
+
+
+
+class PageCache(object):
+    """An in-memory cache of full pages, bounded by the sum of the size of
+    the bodies (in bytes), values are evicted in LRU order.
+
+    Every page is attached to the path of the resource it was made from, so
+    it can be forgotten when that resource (or a parent or a child of it)
+    changes.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.paths = {}
+        self.total = 0
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+
+    def get(self, key):
+        """Return the (content-type, body) pair for the given key, or None if
+        it is not in the cache.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Mark as recently used
+        self.entries[key] = entry
+        self.hits += 1
+        return entry[1:]
+
+
+    def set(self, key, path, content_type, body):
+        size = len(body)
+        if size > self.size:
+            return
+
+        self._remove(key)
+        self.entries[key] = (path, content_type, body)
+        self.paths.setdefault(path, set()).add(key)
+        self.total += size
+        while self.total > self.size:
+            key = next(iter(self.entries))
+            self._remove(key)
+            self.evictions += 1
+
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        path, content_type, body = entry
+        self.total -= len(body)
+        keys = self.paths[path]
+        keys.discard(key)
+        if not keys:
+            del self.paths[path]
+
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.paths.clear()
+        self.total = 0
+
+
+    def invalidate(self, paths):
+        """Forget the pages made from the given resources, from their parents
+        (which may list them) and from their children (which may show them,
+        in the breadcrumb for instance).
+        """
+        if not self.entries:
+            return
+
+        prefixes = set()
+        for path in paths:
+            path = path.rstrip('/')
+            # Any change to the root or the configuration may show anywhere
+            if not path or path == '/config' or path.startswith('/config/'):
+                self.clear()
+                return
+            prefixes.add(path + '/')
+
+        for cached_path in self.paths.keys():
+            prefix = cached_path.rstrip('/') + '/'
+            for path in prefixes:
+                if path.startswith(prefix) or prefix.startswith(path):
+                    for key in list(self.paths[cached_path]):
+                        self._remove(key)
+                        self.invalidations += 1
+                    break
+
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'size': self.total,
+            'max-size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit-rate': (float(self.hits) / total) if total else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations}
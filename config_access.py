@@ -28,6 +28,7 @@ from autoedit import AutoEdit
 from buttons import Remove_BrowseButton
 from config import Configuration
 from config_common import NewResource_Local
+from database import register_commit_listener
 from enumerates import Groups_Datatype
 from fields import Select_Field
 from folder import Folder
@@ -123,6 +124,59 @@ class SearchFormat_Field(Select_Field):
 ###########################################################################
 # Access rule
 ###########################################################################
+def _is_subpath(path, base):
+    """Return True if the given path is the base path or one of its
+    descendants.
+    """
+    if base == '/':
+        return True
+    return path == base or path.startswith(base + '/')
+
+
+def simplify_rules(rules):
+    """Simplify the list of rules (as returned by AccessRule.get_search_key)
+    for the query to be smaller: remove the duplicates, and the rules
+    subsumed by another one with unlimited depth on an ancestor path.
+    """
+    # Remove duplicates
+    rules = sorted(set(rules))
+
+    kept = []
+    for rule in rules:
+        path, depth, format = rule
+        for other in rules:
+            if other == rule:
+                continue
+            o_path, o_depth, o_format = other
+            if o_depth is not None or not _is_subpath(path, o_path):
+                continue
+            if o_format is not None and o_format != format:
+                continue
+            break
+        else:
+            kept.append(rule)
+
+    return kept
+
+
+def get_rules_query(rules):
+    """Return the query for the given rules (an OrQuery), simplified.
+    """
+    query = OrQuery()
+    for path, depth, format in simplify_rules(rules):
+        # Everything
+        if path == '/' and depth is None and format is None:
+            return AllQuery()
+
+        subquery = get_base_path_query(path, 0, depth)
+        if format is not None:
+            subquery = AndQuery(subquery, PhraseQuery('format', format))
+        query.append(subquery)
+
+    return query
+
+
+
 class AccessRule_Results(Folder_BrowseContent):
 
     title = MSG(u'View results')
@@ -187,6 +241,50 @@ class AccessRule(DBResource):
         return query
 
 
+    def get_search_key(self):
+        """Return the tuple (path, depth, format) that defines the resources
+        the rule applies to, see 'simplify_rules'.  The depth is None if
+        unlimited, the format is None if any.
+        """
+        path = self.get_value('search_path') or '/'
+        depth = self.get_value('search_path_depth')
+        if not self.get_value('search_path') or depth == '*':
+            depth = None
+        else:
+            depth = int(depth)
+
+        format = None
+        if self.get_value('permission') != 'add':
+            format = self.get_value('search_format') or None
+
+        return (path.rstrip('/') or '/'), depth, format
+
+
+    def match_resource(self, resource):
+        """Return True if the rule applies to the given resource, i.e. if
+        the resource is found by the query returned by 'get_search_query'.
+        """
+        # Path
+        path = self.get_value('search_path')
+        if path:
+            path = Path(path)
+            abspath = resource.abspath
+            n = len(path)
+            if len(abspath) < n or str(abspath[:n]) != str(path):
+                return False
+            depth = self.get_value('search_path_depth')
+            if depth != '*' and len(abspath) - n > int(depth):
+                return False
+
+        # Format
+        if self.get_value('permission') != 'add':
+            search_format = self.get_value('search_format')
+            if search_format and search_format != resource.metadata.format:
+                return False
+
+        return True
+
+
 
 ###########################################################################
 # Configuration module
@@ -329,14 +427,19 @@ class ConfigAccess(Folder):
         return user_groups, '/config/groups/admins' in user_groups
 
 
-    def get_search_query(self, user, permission, class_id=None):
-        # Special case: admins can see everything
-        user_groups, is_admin = self._get_user_groups(user)
-        if is_admin:
-            return AllQuery()
+    def get_rules_query(self, user_groups, permission, class_id=None):
+        """Return the query of the access rules that apply to the given
+        groups.  The queries are kept in a cache, until the access rules or
+        the groups change.
+        """
+        if permission != 'add':
+            class_id = None
+        key = (tuple(sorted(user_groups)), permission, class_id)
+        rules_query = rules_queries.get(key)
+        if rules_query is not None:
+            return rules_query
 
-        # 1. Back-office access rules
-        rules_query = OrQuery()
+        rules = []
         for rule in self.get_resources():
             if rule.get_value('permission') != permission:
                 continue
@@ -349,7 +452,64 @@ class ConfigAccess(Folder):
                 if class_id and r_format and class_id != r_format:
                     continue
 
-            rules_query.append(rule.get_search_query())
+            rules.append(rule.get_search_key())
+
+        rules_query = get_rules_query(rules)
+        rules_queries[key] = rules_query
+        return rules_query
+
+
+    def get_readable_by(self, resource):
+        """Return the values of the 'readable_by' field of the given
+        resource: the pairs "<group>|<share>" made of the groups of the
+        'view' access rules that apply to the resource, and of the groups
+        (or users) the resource is shared with; plus "owner|<owner>".
+
+        Then the 'view' access is decided by one search, see
+        get_readable_query.
+        """
+        groups = set()
+        for rule in self.get_resources():
+            if rule.get_value('permission') != 'view':
+                continue
+            if rule.match_resource(resource):
+                groups.add(rule.get_value('group'))
+
+        share = resource.get_share() or []
+        readable_by = [ '%s|%s' % (x, y) for x in groups for y in share ]
+        owner = resource.get_owner()
+        if owner:
+            readable_by.append('owner|%s' % owner)
+        return readable_by
+
+
+    def get_readable_query(self, user, user_groups):
+        if not user:
+            return PhraseQuery('readable_by', 'everybody|everybody')
+
+        user_path = str(user.abspath)
+        share = list(user_groups) + [user_path]
+        query = OrQuery(*[ PhraseQuery('readable_by', '%s|%s' % (x, y))
+                           for x in user_groups for y in share ])
+        query.append(PhraseQuery('readable_by', 'owner|%s' % user_path))
+        return query
+
+
+    def get_search_query(self, user, permission, class_id=None):
+        # Special case: admins can see everything
+        user_groups, is_admin = self._get_user_groups(user)
+        if is_admin:
+            return AllQuery()
+
+        # Special case: the 'view' access is indexed (and up to date, see
+        # Server.index_access_queue)
+        server = getattr(get_context(), 'server', None)
+        if (permission == 'view' and server is not None and server.index_access
+                and server.access_queue.is_empty()):
+            return self.get_readable_query(user, user_groups)
+
+        # 1. Back-office access rules
+        rules_query = self.get_rules_query(user_groups, permission, class_id)
 
         # Case: anonymous
         if not user:
@@ -378,6 +538,26 @@ class ConfigAccess(Folder):
         return len(results) > 0
 
 
+    def has_permissions(self, user, permission, resources, class_id=None):
+        """Return the list of resources, from the given ones, the user has
+        the given permission on.  Only one search is done.
+        """
+        resources = [ x for x in resources if x is not None ]
+        if not resources:
+            return []
+
+        # The query
+        paths = [ PhraseQuery('abspath', str(x.abspath)) for x in resources ]
+        query = AndQuery(
+            self.get_search_query(user, permission, class_id),
+            OrQuery(*paths))
+
+        # Search
+        results = get_context().search(query)
+        allowed = set([ x.abspath for x in results.get_documents() ])
+        return [ x for x in resources if str(x.abspath) in allowed ]
+
+
     def get_document_types(self):
         return [AccessRule]
 
@@ -391,3 +571,22 @@ class ConfigAccess(Folder):
 
 # Register
 Configuration.register_module(ConfigAccess)
+
+
+
+###########################################################################
+# Cache of the access rules queries
+###########################################################################
+# {(user groups, permission, class_id): query}
+rules_queries = {}
+
+def _on_commit(database, paths):
+    """Clear the cache when the access rules or the groups change.
+    """
+    prefixes = ('/config/access', '/config/groups')
+    for path in paths:
+        if path.startswith(prefixes):
+            rules_queries.clear()
+            return
+
+register_commit_listener(_on_commit)
@@ -29,6 +29,7 @@ from autoedit import AutoEdit
 from autoform import PathSelectorWidget
 from config import Configuration
 from config_common import NewResource_Local
+from database import register_commit_listener
 from buttons import Remove_BrowseButton
 from fields import Select_Field, URI_Field
 from order import OrderedFolder, OrderedFolder_BrowseContent
@@ -48,6 +49,23 @@ class Target_Field(Select_Field):
 
 
 
+###########################################################################
+# Cache of the menus (see MenuItem.get_menu_tree)
+###########################################################################
+# {menu path: tree}
+menu_trees = {}
+# {(menu path, user path): set of the menu items the user can access}
+menu_access = {}
+
+def _on_commit(database, paths):
+    # Any commit may change the resources the menus link to
+    menu_trees.clear()
+    menu_access.clear()
+
+register_commit_listener(_on_commit)
+
+
+
 class MenuItem_Browse(OrderedFolder_BrowseContent):
 
     search_widgets = None
@@ -132,7 +150,129 @@ class MenuItem(OrderedFolder):
         return len(resource_views) > 0
 
 
-    def get_menu_namespace_level(self, context, url, use_first_child=False):
+    def get_menu_tree(self):
+        """Return the tree of the menu items, a list of dicts:
+
+          {'abspath': <path of the menu item>,
+           'uri': <the value of the 'path' field>,
+           'target': <path of the resource it links to, None if external
+                      or broken>,
+           'children': [...]}
+
+        It is built once per commit.
+        """
+        key = str(self.abspath)
+        tree = menu_trees.get(key)
+        if tree is None:
+            tree = self._build_menu_tree()
+            menu_trees[key] = tree
+        return tree
+
+
+    def _build_menu_tree(self):
+        tree = []
+        for item in self.get_resources_in_order():
+            uri = item.get_value('path')
+            ref, path, view = split_reference(uri)
+            target = None
+            if ref is not None and path != '' and not ref.scheme:
+                target = self.get_resource(path, soft=True)
+                if target is not None:
+                    target = str(target.abspath)
+            tree.append({
+                'abspath': str(item.abspath),
+                'uri': uri,
+                'target': target,
+                'children': item._build_menu_tree()})
+        return tree
+
+
+    def get_menu_access(self, context, tree):
+        """Return the set of paths of the menu items (in the given tree) the
+        user is allowed to access.  The 'view' permission is checked at once
+        for all the resources the menu links to.
+        """
+        user = context.user
+        key = (str(self.abspath), str(user.abspath) if user else None)
+        allowed = menu_access.get(key)
+        if allowed is not None:
+            return allowed
+
+        # Flatten the tree
+        nodes = []
+        stack = list(tree)
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node['children'])
+
+        # Check the 'view' permission for all the targets
+        database = context.database
+        targets = set([ x['target'] for x in nodes if x['target'] ])
+        targets = [ database.get_resource(x) for x in targets ]
+        viewable = context.root.has_permissions(user, 'view', targets)
+        viewable = set([ str(x.abspath) for x in viewable ])
+
+        # The items
+        allowed = set()
+        for node in nodes:
+            if self._is_node_allowed(context, node, viewable):
+                allowed.add(node['abspath'])
+
+        if len(menu_access) >= 10000:
+            menu_access.clear()
+        menu_access[key] = allowed
+        return allowed
+
+
+    def _is_node_allowed(self, context, node, viewable):
+        """Same as '_is_allowed_to_access', but the views only protected by
+        the 'view' permission are checked against the given set of paths.
+        """
+        ref, path, view = split_reference(node['uri'])
+
+        # Broken entry
+        if ref is None or path == '':
+            return False
+
+        # External link
+        if ref.scheme:
+            return True
+
+        # Broken link
+        target = node['target']
+        if target is None:
+            return False
+        resource = context.database.get_resource(target)
+
+        if view:
+            # Remove the first '/;' of the view
+            view = resource.get_view(view[2:], ref.query)
+            if not view:
+                return False
+            views = [view]
+        else:
+            # Access to any view of the resource
+            views = [ resource.get_view(x.split('?')[0])
+                      for x in resource.class_views ]
+
+        for view in views:
+            if view is None:
+                continue
+            if view.access == 'is_allowed_to_view':
+                if target in viewable:
+                    return True
+            elif context.is_access_allowed(resource, view):
+                return True
+        return False
+
+
+    def get_menu_namespace_level(self, context, url, use_first_child=False,
+                                 tree=None, allowed=None):
+        if tree is None:
+            tree = self.get_menu_tree()
+            allowed = self.get_menu_access(context, tree)
+
         menu_abspath = self.abspath
         here = context.resource
         here_abspath = here.abspath
@@ -140,10 +280,12 @@ class MenuItem(OrderedFolder):
         here_abspath_and_view = '%s/%s' % (here_abspath, here_view_name)
         items = []
 
-        for resource in self.get_resources_in_order():
-            uri = resource.get_value('path')
-            if not self._is_allowed_to_access(context, uri):
+        database = context.database
+        for node in tree:
+            if node['abspath'] not in allowed:
                 continue
+            resource = database.get_resource(node['abspath'])
+            uri = node['uri']
             ref, path, view = split_reference(uri)
             title = resource.get_value('title')
             target = resource.get_value('target')
@@ -166,7 +308,9 @@ class MenuItem(OrderedFolder):
             # Case 2: Internal link
             # Sub level
             subtabs = resource.get_menu_namespace_level(context, url,
-                                                        use_first_child)
+                                                        use_first_child,
+                                                        node['children'],
+                                                        allowed)
             resource = self.get_resource(path, soft=True)
             item_id = 'menu_%s' % resource.name
 
@@ -32,6 +32,12 @@ class CMSContext(Context):
     message = None
     content_type = None
 
+    # The permissions memo, see Root.has_permission
+    permissions = None
+    permissions_version = None
+    permissions_hits = 0
+    permissions_misses = 0
+
     def come_back(self, message, goto=None, keep=freeze([]), **kw):
         goto = super(CMSContext, self).come_back(message, goto, keep, **kw)
         # Keep fancybox
@@ -96,6 +102,30 @@ class CMSContext(Context):
         return ro_database.get_handler(local_path)
 
 
+    #######################################################################
+    # Permissions
+    def get_cached_permission(self, key):
+        """Return the result of the permission check identified by the
+        given key, if it was already done, or None.  The cache is cleared
+        as soon as the database changes.
+        """
+        version = getattr(self.database, 'change_count', None)
+        if self.permissions is None or self.permissions_version != version:
+            self.permissions = {}
+            self.permissions_version = version
+
+        value = self.permissions.get(key)
+        if value is None:
+            self.permissions_misses += 1
+        else:
+            self.permissions_hits += 1
+        return value
+
+
+    def set_cached_permission(self, key, value):
+        self.permissions[key] = value
+
+
     #######################################################################
     # Search
     @proto_lazy_property
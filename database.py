@@ -14,20 +14,430 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+# Import from the Standard Library
+from itertools import islice
+from multiprocessing import Pool
+from os.path import dirname
+from time import time
+
 # Import from itools
+from itools.core import get_pipe
 from itools.database import RODatabase, RWDatabase, make_git_database
-from itools.database import OrQuery, PhraseQuery
+from itools.database import PhraseQuery
+from itools.fs import lfs
+from itools.log import log_error, log_info, log_warning
 from itools.uri import Path
 from itools.web import get_context
 
 
-class Database(RWDatabase):
+
+###########################################################################
+# Commit listeners
+###########################################################################
+commit_listeners = []
+
+def register_commit_listener(listener):
+    """The given callable will be called after every commit, with the
+    database and the list of the paths of the resources that changed.  The
+    replicas call it when they load a new commit.
+    """
+    commit_listeners.append(listener)
+
+
+
+class ReverseDependencies(object):
+    """Keeps in memory the 'onchange_reindex' relation of the catalog, in
+    both directions:
+
+    - dependents: for every resource, the resources that must be re-indexed
+      when it changes
+    - dependencies: for every resource, the resources it depends on (this is
+      what the catalog stores)
+
+    All the paths are absolute paths, as byte strings.
+    """
+
+    def __init__(self):
+        self.dependents = {}
+        self.dependencies = {}
+
+
+    def load(self, catalog):
+        """Build the relation from the catalog.
+        """
+        self.dependents.clear()
+        self.dependencies.clear()
+        for dependency in catalog.get_unique_values('onchange_reindex'):
+            query = PhraseQuery('onchange_reindex', dependency)
+            for brain in catalog.search(query).get_documents():
+                path = brain.abspath
+                self.dependencies.setdefault(path, set()).add(dependency)
+                self.dependents.setdefault(dependency, set()).add(path)
+
+
+    def add(self, path, dependencies):
+        """Set the dependencies of the given resource, as returned by its
+        'get_onchange_reindex' method.
+        """
+        self.remove(path)
+        if not dependencies:
+            return
+
+        if type(dependencies) is str:
+            dependencies = [dependencies]
+        dependencies = set([ str(x) for x in dependencies ])
+        self.dependencies[path] = dependencies
+        for dependency in dependencies:
+            self.dependents.setdefault(dependency, set()).add(path)
+
+
+    def remove(self, path):
+        for dependency in self.dependencies.pop(path, ()):
+            dependents = self.dependents[dependency]
+            dependents.discard(path)
+            if not dependents:
+                del self.dependents[dependency]
+
+
+    def get_dependents(self, paths):
+        """Return the resources to re-index when the given resources change,
+        following the dependencies transitively.
+        """
+        dependents = self.dependents
+        to_reindex = set()
+        seen = set(paths)
+        stack = list(seen)
+        while stack:
+            path = stack.pop()
+            for dependent in dependents.get(path, ()):
+                to_reindex.add(dependent)
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+
+        return to_reindex
+
+
+    def check(self, catalog):
+        """Compare the relation kept in memory with the catalog, return the
+        list of paths for which they differ.
+        """
+        expected = ReverseDependencies()
+        expected.load(catalog)
+
+        aux = set(self.dependencies) | set(expected.dependencies)
+        errors = [ x for x in aux
+                   if self.dependencies.get(x) != expected.dependencies.get(x)
+                 ]
+        errors.sort()
+        return errors
+
+
+
+class CommitStats(object):
+    """Keeps the time spent by every phase of the commits, and the number
+    of resources processed by each phase (see Database._before_commit).
+    """
+
+    phases = ('move', 'onchange_reindex', 'unindex', 'mtime', 'index',
+              'git_metadata', 'save')
+
+    def __init__(self):
+        self.commits = 0
+        self.slow_commits = 0
+        # {phase: [seconds, resources]}
+        self.totals = dict([ (x, [0.0, 0]) for x in self.phases ])
+        self.last = None
+        # The commit being done
+        self.current = []
+        self.slowest = None
+        self.t0 = self.t1 = None
+
+
+    def start(self):
+        self.current = []
+        self.slowest = None
+        self.t0 = self.t1 = time()
+
+
+    def phase(self, name, count):
+        t1 = time()
+        self.current.append((name, t1 - self.t1, count))
+        self.t1 = t1
+
+
+    def set_slowest(self, path, seconds):
+        """Keep the resource that took the longest to index.
+        """
+        if self.slowest is None or seconds > self.slowest[1]:
+            self.slowest = (path, seconds)
+
+
+    def stop(self):
+        """Account the commit just done, and return its duration in
+        seconds.
+        """
+        total = self.t1 - self.t0
+        self.commits += 1
+        for name, seconds, count in self.current:
+            totals = self.totals[name]
+            totals[0] += seconds
+            totals[1] += count
+        self.last = {
+            'time': total,
+            'phases': [ list(x) for x in self.current ],
+            'slowest': self.slowest}
+        return total
+
+
+    def format_last(self):
+        phases = [ '%s=%dms/%d' % (name, seconds * 1000, count)
+                   for name, seconds, count in self.last['phases'] ]
+        phases = ' '.join(phases)
+        slowest = self.last['slowest']
+        if slowest:
+            phases += ' slowest=%s (%dms)' % (slowest[0], slowest[1] * 1000)
+        return phases
+
+
+    def get_stats(self):
+        return {
+            'commits': self.commits,
+            'slow-commits': self.slow_commits,
+            'totals': self.totals,
+            'last': self.last}
+
+
+
+class CacheStats(object):
+    """Mixin class for the databases, to keep statistics of the handlers
+    cache, and to adapt its size to a memory budget.
+    """
+
+    # The number of handlers looked at to estimate the size of an entry
+    entry_sample = 100
+
+    def __init__(self, *args, **kw):
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        super(CacheStats, self).__init__(*args, **kw)
+
+
+    def get_handler(self, key, cls=None, soft=False):
+        key = self.normalize_key(key)
+        if key in self.cache:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        return super(CacheStats, self).get_handler(key, cls, soft)
+
+
+    def make_room(self):
+        # Only the handlers removed to make room are evictions (not the ones
+        # discarded by the replicas, or the big files)
+        size = len(self.cache)
+        super(CacheStats, self).make_room()
+        self.cache_evictions += size - len(self.cache)
+
+
+    def get_entry_size(self):
+        """Return the approximate memory used by every entry of the cache, in
+        bytes: the average size of the files of a sample of the handlers
+        (once loaded a handler uses about the size of its file).
+        """
+        fs = self.fs
+        sizes = []
+        for key, handler in islice(self.cache.iteritems(), self.entry_sample):
+            if handler.dirty is None and fs.is_file(key):
+                sizes.append(fs.get_size(key))
+        if not sizes:
+            return None
+        return max(sum(sizes) / len(sizes), 1)
+
+
+    def adapt_cache_size(self, budget):
+        """Grow or shrink the bounds of the cache, so the memory it uses
+        goes towards the given budget (in bytes).  The bounds change at most
+        25% every time.
+        """
+        entry_size = self.get_entry_size()
+        if entry_size is None:
+            return
+
+        cache = self.cache
+        size_max = budget / entry_size
+        size_max = max(size_max, cache.size_max * 3 / 4)
+        size_max = min(size_max, cache.size_max * 5 / 4)
+        size_max = max(size_max, 1000)
+        if size_max == cache.size_max:
+            return
+
+        # Keep the ratio of the defaults (19500:20500)
+        cache.size_max = size_max
+        cache.size_min = size_max * 95 / 100
+        self.make_room()
+        log_info('Database cache size: %d:%d' % (cache.size_min, size_max),
+                 domain='ikaaro')
+
+
+    def get_cache_stats(self):
+        cache = self.cache
+        total = self.cache_hits + self.cache_misses
+        return {
+            'size': len(cache),
+            'size-min': cache.size_min,
+            'size-max': cache.size_max,
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit-rate': (float(self.cache_hits) / total) if total else None,
+            'evictions': self.cache_evictions,
+            'entry-size': self.get_entry_size()}
+
+
+
+class DynamicClasses(object):
+    """Mixin class for the databases, keeps the list of the dynamic classes
+    (defined by the models) so they are not searched every time.
+    """
+
+    def __init__(self, *args, **kw):
+        self.dynamic_class_ids = None
+        super(DynamicClasses, self).__init__(*args, **kw)
+
+
+    def get_dynamic_classes(self):
+        class_ids = self.dynamic_class_ids
+        if class_ids is None:
+            search = self.search(base_classes='-model')
+            class_ids = [ x.abspath for x in search.get_documents() ]
+            self.dynamic_class_ids = class_ids
+
+        for class_id in class_ids:
+            yield self.get_resource_class(class_id)
+
+
+    def notify_commit(self, paths):
+        for listener in commit_listeners:
+            listener(self, paths)
+
+
+
+class Database(CacheStats, DynamicClasses, RWDatabase):
     """Adds a Git archive to the itools database.
     """
 
+    def __init__(self, path, size_min, size_max):
+        super(Database, self).__init__(path, size_min, size_max)
+        # The 'onchange_reindex' relation, loaded once from the catalog and
+        # then updated at every commit
+        self.reverse_dependencies = ReverseDependencies()
+        self.reverse_dependencies.load(self.catalog)
+        # Instrumentation
+        self.commit_stats = CommitStats()
+        # Incremented every time a resource changes (used by the caches that
+        # live within a request, like the permissions memo of the context)
+        self.change_count = 0
+        # Group commit (see Server): the Git commits and catalog saves of
+        # the write requests are deferred and then done at once
+        self.group_commit_max = 0
+        self.pending_commits = []
+        self.group_commit_journal = '%s/group-commit' % self.path
+        # The files bigger than this (in bytes) are not kept in the cache
+        # once saved (see Server)
+        self.large_file_size = None
+
+
+    def add_resource(self, *args, **kw):
+        self.change_count += 1
+        super(Database, self).add_resource(*args, **kw)
+
+
+    def change_resource(self, *args, **kw):
+        self.change_count += 1
+        super(Database, self).change_resource(*args, **kw)
+
+
+    def remove_resource(self, *args, **kw):
+        self.change_count += 1
+        super(Database, self).remove_resource(*args, **kw)
+
+
+    def move_resource(self, *args, **kw):
+        self.change_count += 1
+        super(Database, self).move_resource(*args, **kw)
+
+
+    def check_reverse_dependencies(self):
+        """Check the 'onchange_reindex' relation kept in memory is
+        consistent with the catalog.  Log a warning for every resource that
+        is not, and return False if there is any.
+        """
+        errors = self.reverse_dependencies.check(self.catalog)
+        for path in errors:
+            log_warning('onchange_reindex mismatch: %s' % path,
+                        domain='ikaaro')
+        return len(errors) == 0
+
+
+    def update_reverse_dependencies(self, docs_to_index, docs_to_unindex):
+        """Update the 'onchange_reindex' relation after the catalog has
+        been updated.  The 'docs_to_index' parameter is a list of catalog
+        values, 'docs_to_unindex' a list of paths.
+        """
+        reverse_dependencies = self.reverse_dependencies
+        for path in docs_to_unindex:
+            reverse_dependencies.remove(path)
+        for values in docs_to_index:
+            path = values['abspath']
+            reverse_dependencies.add(path, values.get('onchange_reindex'))
+
+
+    def get_catalog_values(self, resources):
+        """Return the list of tuples (resource, catalog values) for the
+        given resources.
+
+        If the server is configured with 'index-workers', and there are
+        enough resources, the values are computed in parallel by worker
+        processes (forked now, so they see the changes not yet committed).
+        If anything goes wrong, fall back to computing them here.
+        """
+        server = getattr(get_context(), 'server', None)
+        workers = server.index_workers if server else 0
+        values = None
+        if workers and len(resources) >= server.index_workers_threshold:
+            paths = [ str(x.abspath) for x in resources ]
+            chunksize = max(1, len(paths) / (workers * 4))
+            pool = Pool(workers)
+            try:
+                values = pool.map(_get_catalog_values, paths, chunksize)
+            except Exception:
+                log_error('Parallel indexation failed', domain='ikaaro')
+            finally:
+                pool.terminate()
+                pool.join()
+
+            if values is not None:
+                log = 'Indexed %d resources with %d workers'
+                log_info(log % (len(paths), workers), domain='ikaaro')
+
+        # Serial (the default)
+        if values is None:
+            values = []
+            stats = self.commit_stats
+            for resource in resources:
+                t0 = time()
+                values.append(resource.get_catalog_values())
+                stats.set_slowest(str(resource.abspath), time() - t0)
+
+        return zip(resources, values)
+
+
     def _before_commit(self):
         context = get_context()
         root = context.root
+        stats = self.commit_stats
+        stats.start()
 
         # 1. Update links when resources moved
         # XXX With this code '_on_move_resource' is called for new resources,
@@ -39,27 +449,30 @@ class Database(RWDatabase):
             target = Path(target)
             resource = root.get_resource(target)
             resource._on_move_resource(source)
+        stats.phase('move', len(old2new))
 
         # 2. Find out resources to re-index because they depend on another
         # resource that changed
-        to_reindex = set()
-        aux = set()
-        aux2 = set(self.resources_old2new.keys())
-        while len(aux) != len(aux2):
-            aux = set(aux2)
-            query = [ PhraseQuery('onchange_reindex', x) for x in aux ]
-            query = OrQuery(*query)
-            search = self.search(query)
-            for brain in search.get_documents():
-                path = brain.abspath
-                aux2.add(path)
-                to_reindex.add(path)
+        changed = self.resources_old2new.keys()
+        to_reindex = self.reverse_dependencies.get_dependents(changed)
+        # The access rules changed, every resource is to be reindexed (the
+        # field 'readable_by', see ConfigAccess.get_readable_by).  This is
+        # done in the background, see Server.index_access_queue
+        server = getattr(context, 'server', None)
+        if server is not None and server.index_access:
+            for path in changed + self.resources_new2old.keys():
+                if path.startswith('/config/access/'):
+                    paths = self.catalog.get_unique_values('abspath')
+                    server.access_queue.set_paths(sorted(paths))
+                    break
+        stats.phase('onchange_reindex', len(to_reindex))
 
         # 3. Documents to unindex (the update_links methods calls
         # 'change_resource' which may modify the resources_old2new dictionary)
         docs_to_unindex = self.resources_old2new.keys()
         docs_to_unindex = list(set(docs_to_unindex) | to_reindex)
         self.resources_old2new.clear()
+        stats.phase('unindex', len(docs_to_unindex))
 
         # 4. Update mtime/last_author
         user = context.user
@@ -69,18 +482,20 @@ class Database(RWDatabase):
                 resource = root.get_resource(path)
                 resource.metadata.set_property('mtime', context.timestamp)
                 resource.metadata.set_property('last_author', userid)
+        stats.phase('mtime', len(self.resources_new2old)
+                             if context.set_mtime else 0)
 
         # 5. Index
         docs_to_index = self.resources_new2old.keys()
         docs_to_index = list(set(docs_to_index) | to_reindex)
-        aux = []
+        resources = []
         for path in docs_to_index:
             resource = root.get_resource(path, soft=True)
             if resource:
-                values = resource.get_catalog_values()
-                aux.append((resource, values))
-        docs_to_index = aux
+                resources.append(resource)
+        docs_to_index = self.get_catalog_values(resources)
         self.resources_new2old.clear()
+        stats.phase('index', len(docs_to_index))
 
         # 6. Find out commit author & message
         if user:
@@ -100,14 +515,282 @@ class Database(RWDatabase):
 
         # Ok
         git_date = context.fix_tzinfo(context.timestamp)
+        stats.phase('git_metadata', 1)
         return git_author, git_date, git_msg, docs_to_index, docs_to_unindex
 
 
-    def get_dynamic_classes(self):
-        search = self.search(base_classes='-model')
-        for brain in search.get_documents():
-            class_id = brain.abspath
-            yield self.get_resource_class(class_id)
+    def _save_changes(self, data):
+        if self.group_commit_max:
+            self._defer_changes(data)
+        else:
+            super(Database, self)._save_changes(data)
+
+        # Keep the 'onchange_reindex' relation in sync with the catalog
+        git_author, git_date, git_msg, docs_to_index, docs_to_unindex = data
+        resources = [ resource for resource, values in docs_to_index ]
+        docs_to_index = [ values for resource, values in docs_to_index ]
+        self.update_reverse_dependencies(docs_to_index, docs_to_unindex)
+
+        # Do not keep the big files (e.g. uploads) in memory
+        self.discard_large_files(resources)
+
+        # Listeners
+        paths = [ x['abspath'] for x in docs_to_index ]
+        self.notify_commit(list(set(paths) | set(docs_to_unindex)))
+
+        # Deferred full-text indexing
+        server = getattr(get_context(), 'server', None)
+        if server is not None and server.index_text == 'deferred':
+            server.text_queue.push(paths)
+
+        # Instrumentation
+        stats = self.commit_stats
+        stats.phase('save', len(docs_to_index) + len(docs_to_unindex))
+        seconds = stats.stop()
+        threshold = server.slow_commit_threshold if server else 0
+        if threshold and seconds * 1000 >= threshold:
+            stats.slow_commits += 1
+            log = '%dms %s: %s' % (seconds * 1000, git_msg,
+                                   stats.format_last())
+            log_warning(log, domain='ikaaro.slow-commits')
+
+        # Group commit, the batch is full
+        if len(self.pending_commits) >= self.group_commit_max > 0:
+            self.flush_commits()
+
+
+    def discard_large_files(self, resources):
+        """Removes from the cache the handlers of the given resources whose
+        file is bigger than 'large_file_size'.  They are saved already, and
+        will be read again from the file if needed.
+        """
+        size = self.large_file_size
+        if not size:
+            return
+
+        fs = self.fs
+        cache = self.cache
+        for resource in resources:
+            for handler in resource.get_handlers():
+                key = handler.key
+                if key not in cache or handler.dirty is not None:
+                    continue
+                if fs.is_file(key) and fs.get_size(key) >= size:
+                    self._discard_handler(key)
+
+
+    def _defer_changes(self, data):
+        """Like RWDatabase._save_changes, but the Git commit and the catalog
+        save are left to 'flush_commits'.  The paths of the resources are
+        kept in a journal, to recover if the server stops before the flush
+        (see 'recover_group_commit').
+        """
+        git_author, git_date, git_msg, docs_to_index, docs_to_unindex = data
+
+        # 1. Journal
+        paths = [ str(resource.abspath) for resource, values in docs_to_index ]
+        paths.extend(docs_to_unindex)
+        journal = open(self.group_commit_journal, 'a')
+        try:
+            journal.write(''.join([ '%s\n' % x for x in paths ]))
+        finally:
+            journal.close()
+
+        # 2. Synchronize the handlers and the filesystem
+        fs = self.fs
+        cache = self.cache
+        added = self.added
+        for key in added:
+            handler = cache.get(key)
+            if handler and handler.dirty:
+                parent_path = dirname(key)
+                if not fs.exists(parent_path):
+                    fs.make_folder(parent_path)
+                handler.save_state()
+
+        changed = self.changed
+        for key in changed:
+            cache[key].save_state()
+
+        # 3. Git add, the commit is deferred
+        self.pending_commits.append((git_msg or 'no comment', git_author,
+                                     git_date))
+        self.worktree.git_add(*(list(added) + list(changed)))
+        changed.clear()
+        added.clear()
+
+        # 4. Catalog, saved with the commit
+        catalog = self.catalog
+        for path in docs_to_unindex:
+            catalog.unindex_document(path)
+        for resource, values in docs_to_index:
+            catalog.index_document(values)
+
+
+    def _abort_changes(self):
+        # The requests deferred by the group commit are acknowledged already,
+        # commit them before the worktree and the catalog are reset
+        self.flush_commits()
+        super(Database, self)._abort_changes()
+
+
+    def flush_commits(self):
+        """Make one Git commit and one catalog save for all the write
+        requests deferred by the group commit.
+        """
+        pending = self.pending_commits
+        if not pending:
+            return
+        self.pending_commits = []
+
+        # Only one request, commit as usual
+        message, author, date = pending[-1]
+        if len(pending) > 1:
+            lines = [ 'Group commit of %d requests' % len(pending), '' ]
+            for x_message, x_author, x_date in pending:
+                x_author = '%s <%s>' % x_author if x_author else 'nobody'
+                lines.append('%s %s: %s' % (x_date, x_author, x_message))
+            message = '\n'.join(lines)
+            if len(set([ x[1] for x in pending ])) > 1:
+                author = ('nobody', 'nobody')
+
+        try:
+            self.worktree.git_commit(message, author, date)
+        finally:
+            self.catalog.save_changes()
+        if lfs.exists(self.group_commit_journal):
+            lfs.remove(self.group_commit_journal)
+
+
+    def save_catalog(self):
+        """Save the changes done to the catalog out of a transaction (e.g.
+        the deferred full-text indexing).  Use this method instead of
+        'catalog.save_changes', so the requests deferred by the group commit
+        are committed first.
+        """
+        self.flush_commits()
+        self.catalog.save_changes()
+
+
+    def read_group_commit_journal(self):
+        """Return the paths of the resources changed by a group commit that
+        was not flushed (the server stopped), and forget them.
+        """
+        journal = self.group_commit_journal
+        if not lfs.exists(journal):
+            return []
+
+        paths = set([ x.strip() for x in open(journal) if x.strip() ])
+        lfs.remove(journal)
+        return sorted(paths)
+
+
+
+class ReadOnlyDatabase(CacheStats, DynamicClasses, RODatabase):
+    """The itools read-only database, with the statistics of the cache.
+    """
+
+
+
+class ReplicaDatabase(ReadOnlyDatabase):
+    """A read-only database that follows the commits done by the process
+    that writes (it must run on the same instance).  The method 'sync' must
+    be called regularly, see Server.replica_manager
+    """
+
+    def __init__(self, path, size_min, size_max):
+        super(ReplicaDatabase, self).__init__(path, size_min, size_max)
+        self.git_path = '%s/database' % path
+        self.head = self.get_head()
+
+
+    def get_head(self):
+        command = ['git', 'rev-parse', 'HEAD']
+        return get_pipe(command, cwd=self.git_path).strip()
+
+
+    def sync(self):
+        """Reopen the catalog, and load the commits done since the last
+        call: the handlers changed are removed from the cache.  Return the
+        list of keys that changed.
+        """
+        # Catalog, reopened every time: it is saved after the Git commit,
+        # and may be saved without commit (deferred full-text, access queue,
+        # time events)
+        self.catalog._db.reopen()
+
+        head = self.get_head()
+        if head == self.head:
+            return []
+
+        command = ['git', '-c', 'core.quotepath=off', 'diff', '--name-only',
+                   '-z', self.head, head]
+        data = get_pipe(command, cwd=self.git_path)
+        keys = [ x for x in data.split('\0') if x ]
+        self.head = head
+
+        # Handlers (and their folders), the keys given by Git are normalized
+        # as the keys of the cache
+        cache = self.cache
+        for key in keys:
+            path = Path(key)
+            while path:
+                key = self.normalize_key(str(path))
+                if key in cache:
+                    self._discard_handler(key)
+                path = path[:-1]
+
+        # Listeners (the metadata of every resource changed is changed too,
+        # if only the mtime)
+        paths = [ '/%s' % x[:-9] for x in keys if x.endswith('.metadata') ]
+        self.notify_commit(paths)
+
+        return keys
+
+
+
+def _on_commit_models(database, paths):
+    """The dynamic classes are built from the models (in /config/models),
+    forget them when a model or one of its fields changes.
+    """
+    prefix = '/config/models/'
+    changed = False
+    for path in paths:
+        if path.startswith(prefix):
+            class_id = prefix + path[len(prefix):].split('/')[0]
+            database._resources_registry.pop(class_id, None)
+            changed = True
+
+    if changed:
+        database.dynamic_class_ids = None
+
+register_commit_listener(_on_commit_models)
+
+
+
+def _get_catalog_values(path):
+    """Used by the worker processes to compute the catalog values.
+    """
+    resource = get_context().root.get_resource(path)
+    return resource.get_catalog_values()
+
+
+
+def recover_group_commit(target):
+    """If the server stopped before it flushed a group commit, the files of
+    the requests are written but not committed: commit them, so the
+    database is consistent again.  The resources are reindexed by the server
+    when it starts (see Server.reindex_group_commit).
+    """
+    if not lfs.exists('%s/group-commit' % target):
+        return False
+
+    cwd = '%s/database' % target
+    get_pipe(['git', 'add', '-A'], cwd=cwd)
+    if get_pipe(['git', 'status', '--porcelain'], cwd=cwd):
+        command = ['git', 'commit', '-q', '-m', 'Recovered group commit']
+        get_pipe(command, cwd=cwd)
+    return True
 
 
 
@@ -117,8 +800,10 @@ def make_database(path):
     return Database(path, size_min, size_max)
 
 
-def get_database(path, size_min, size_max, read_only=False):
+def get_database(path, size_min, size_max, read_only=False, replica=False):
+    if replica is True:
+        return ReplicaDatabase(path, size_min, size_max)
     if read_only is True:
-        return RODatabase(path, size_min, size_max)
+        return ReadOnlyDatabase(path, size_min, size_max)
 
     return Database(path, size_min, size_max)
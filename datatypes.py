@@ -122,6 +122,53 @@ class ExpireValue(DataType):
         return str(int(value.total_seconds() / 60))
 
 
+class IndexTextValue(DataType):
+    """The value of the 'index-text' option: True, False or 'deferred'.
+    """
+    @staticmethod
+    def decode(value):
+        value = value.strip().lower()
+        if value == 'deferred':
+            return value
+        return bool(int(value))
+
+
+    @staticmethod
+    def encode(value):
+        if value == 'deferred':
+            return value
+        return '1' if value else '0'
+
+
+
+class DataSize(DataType):
+    """A size in bytes, the suffixes K, M and G are supported (e.g. 2G).
+    """
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+    @classmethod
+    def decode(cls, value):
+        value = value.strip().upper()
+        if not value:
+            return None
+        unit = cls.units.get(value[-1])
+        if unit is None:
+            return int(value)
+        return int(value[:-1]) * unit
+
+
+    @classmethod
+    def encode(cls, value):
+        if value is None:
+            return ''
+        for suffix in 'GMK':
+            unit = cls.units[suffix]
+            if value % unit == 0:
+                return '%d%s' % (value / unit, suffix)
+        return str(value)
+
+
+
 class BirthDate(Date):
     pass
 
@@ -20,10 +20,13 @@
 
 # Import from itools
 from itools.core import guess_all_extensions
+from itools.database import register_field
+from itools.datatypes import Integer, String
 from itools.gettext import MSG
 from itools.handlers import File as FileHandler
 from itools.handlers import Image as ImageHandler, SVGFile
 from itools.handlers import TARFile, ZIPFile, GzipFile, Bzip2File
+from itools.log import log_warning
 from itools.odf import SXWFile, SXCFile, SXIFile, ODTFile, ODSFile, ODPFile
 from itools.pdf import PDFFile
 from itools.office import RTF as RTFFile
@@ -34,6 +37,7 @@ from itools.office import MSPowerPointX as MSPowerPointXFile
 from itools.web import get_context
 
 # Import from ikaaro
+from cache import get_blob_id
 from content import Content
 from database import Database
 from fields import Char_Field, File_Field, Owner_Field
@@ -42,7 +46,10 @@ from file_views import File_Edit, File_ExternalEdit, File_ExternalEdit_View
 from file_views import File_Download
 from file_views import Image_View, Video_View, Archive_View
 from file_views import Flash_View
+from folder import Folder
+from resize import ResizeBusy
 from resource_views import DBResource_GetImage
+from utils import get_handler_blob_id, get_image_sizes, get_thumbnail
 
 
 
@@ -91,6 +98,36 @@ class File(Content):
         return self.get_value('data').to_text()
 
 
+    def get_catalog_values(self):
+        values = super(File, self).get_catalog_values()
+        handler = self.get_value('data')
+        if handler is not None:
+            values['mimetype'] = handler.get_mimetype()
+        return values
+
+
+    def get_catalog_text(self):
+        # The text extracted from the same data is the same, so look first
+        # in the text cache (if enabled)
+        server = getattr(get_context(), 'server', None)
+        cache = getattr(server, 'text_cache', None)
+        handler = self.get_value('data')
+        if cache is None or handler is None:
+            return super(File, self).get_catalog_text()
+
+        cls = handler.__class__
+        key = '%s.%s:%s' % (cls.__module__, cls.__name__,
+                            get_blob_id(handler.to_str()))
+        text = cache.get(key)
+        if text is not None:
+            return unicode(text, 'utf-8')
+
+        text = super(File, self).get_catalog_text()
+        if text is not None:
+            cache.set(key, text.encode('utf-8'))
+        return text
+
+
     def get_files_to_archive(self, content=False):
         # Handlers
         files = [ x.key for x in self.get_handlers() ]
@@ -130,6 +167,32 @@ class Image(File):
     # Fields
     data = File.data(class_handler=ImageHandler)
 
+    def get_catalog_values(self):
+        values = super(Image, self).get_catalog_values()
+        handler = self.get_value('data')
+        if handler is not None:
+            try:
+                width, height = handler.get_size()
+            except Exception:
+                log_warning('Failed to read the size of %s' % self.abspath,
+                            domain='ikaaro')
+            else:
+                values['image_width'] = width
+                values['image_height'] = height
+        return values
+
+
+    def get_image_size(self):
+        """Returns the (width, height) of the image, from the catalog, or
+        from the image if it is not indexed yet.
+        """
+        sizes = get_image_sizes(get_context(), [self])
+        size = sizes.get(str(self.abspath))
+        if size is None:
+            return self.get_value('data').get_size()
+        return size
+
+
     def get_max_width(self):
         # Auto-reduce width on init
         server = get_context().server
@@ -146,18 +209,70 @@ class Image(File):
         return None
 
 
+    # Set to False while the image is made, then the thumbnails are made
+    # once, after the image is reduced (see init_resource)
+    thumbnails_on_change = True
+
     def init_resource(self, **kw):
-        super(Image, self).init_resource(**kw)
+        self.thumbnails_on_change = False
+        try:
+            super(Image, self).init_resource(**kw)
+        finally:
+            del self.thumbnails_on_change
         # Resize image at max size
         max_width = self.get_max_width()
         max_height = self.get_max_height()
         if max_width or max_height:
             handler = self.get_value('data')
             xsize, ysize = handler.get_size()
-            thumb, format = handler.get_thumbnail(
-                min(xsize, max_width or xsize),
-                min(ysize, max_height or ysize))
+            width = min(xsize, max_width or xsize)
+            height = min(ysize, max_height or ysize)
+            pool = getattr(get_context().server, 'resize_pool', None)
+            if pool is None:
+                thumb, format = handler.get_thumbnail(width, height)
+            else:
+                thumb, format = pool.resize(handler, width, height)
             handler.load_state_from_string(thumb)
+        self.make_thumbnails()
+
+
+    def set_value(self, name, value, language=None, **kw):
+        proxy = super(Image, self)
+        has_changed = proxy.set_value(name, value, language, **kw)
+        if name == 'data' and self.thumbnails_on_change:
+            self.make_thumbnails()
+        return has_changed
+
+
+    def make_thumbnails(self):
+        """Renders in the background the thumbnails of the sizes offered by
+        Image_View and Folder_PreviewContent, if there is a resize pool (and
+        so a thumbnail cache), so they are ready when the image is viewed.
+        Without the pool they are made when first requested.
+        """
+        server = get_context().server
+        if getattr(server, 'resize_pool', None) is None:
+            return
+
+        handler = self.get_value('data')
+        if handler is None:
+            return
+        format = handler.get_mimetype().split('/')[1]
+        sizes = []
+        for size, title in Image_View.sizes:
+            if size != 'original':
+                width, height = size.split('x')
+                sizes.append((int(width), int(height), False))
+        for size in Folder.SIZE_STEPS:
+            sizes.append((size, size, True))
+
+        blob_id = get_handler_blob_id(handler)
+        for width, height, fit in sizes:
+            try:
+                get_thumbnail(handler, width, height, format, fit,
+                              wait=False, blob_id=blob_id)
+            except ResizeBusy:
+                return
 
     # Views
     thumb = DBResource_GetImage(field_name='data')
@@ -409,5 +524,9 @@ class Bzip2(File):
 ###########################################################################
 # Register
 ###########################################################################
+register_field('mimetype', String(indexed=True, stored=True))
+register_field('image_width', Integer(stored=True))
+register_field('image_height', Integer(stored=True))
+
 Database.register_resource_class(File, 'application/octet-stream')
 Database.register_resource_class(ZipArchive, 'application/x-zip-compressed')
@@ -227,7 +227,7 @@ class Image_View(STLView):
             link = ';thumb?width=%s&height=%s' % (width, height)
 
         # Real width and height (displayed for reference)
-        image_width, image_height = resource.get_value('data').get_size()
+        image_width, image_height = resource.get_image_size()
         return {'widths': widths,
                 'link': link,
                 'image_width': image_width,
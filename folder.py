@@ -38,6 +38,7 @@ from datatypes import guess_mimetype
 from exceptions import ConsistencyError
 from fields import HTMLFile_Field
 from folder_views import Folder_BrowseContent, Folder_PreviewContent
+from folder_views import Folder_PreviewContent_JSON
 from folder_views import Folder_Rename, Folder_NewResource, Folder_Thumbnail
 from folder_views import Folder_View
 from messages import MSG_NAME_CLASH
@@ -368,6 +369,7 @@ class Folder(DBResource):
     browse_content = Folder_BrowseContent
     rename = Folder_Rename
     preview_content = Folder_PreviewContent
+    preview_content_json = Folder_PreviewContent_JSON
     thumb = Folder_Thumbnail
 
 
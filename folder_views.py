@@ -14,6 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+# Import from the Standard Library
+from json import dumps
+
 # Import from the Python Image Library
 try:
     from PIL import Image as PILImage
@@ -28,7 +31,7 @@ from itools.gettext import MSG
 from itools.handlers import checkid
 from itools.handlers.utils import transmap
 from itools.html import stream_is_empty
-from itools.uri import get_reference, Path
+from itools.uri import encode_query, get_reference, Path
 from itools.web import BaseView, STLView, get_context
 
 # Import from ikaaro
@@ -39,10 +42,25 @@ from buttons import ZipButton
 from datatypes import CopyCookie
 from exceptions import ConsistencyError
 from utils import generate_name, get_base_path_query, get_content_containers
+from utils import get_image_sizes
 from views import IconsView, BrowseForm, ContextMenu
 import messages
 
 
+def get_allowed_names(resource, context, names, action):
+    """Return the names, from the given ones, of the children the user is
+    allowed to remove, copy or move (the action), see for instance
+    'Root.get_allowed_to_remove'.
+    """
+    children = [ resource.get_resource(x) for x in names ]
+    method = getattr(context.root, 'get_allowed_to_%s' % action)
+    children = method(context.user, children)
+    allowed = set([ str(x.abspath) for x in children ])
+    abspath = resource.abspath
+    return [ x for x in names if str(abspath.resolve2(x)) in allowed ]
+
+
+
 class SearchTypes_Enumerate(Enumerate):
 
     def get_options(self):
@@ -204,10 +222,7 @@ class Folder_Rename(STLView):
     def get_namespace(self, resource, context):
         ids = context.query['ids']
         # Filter names which the authenticated user is not allowed to move
-        root = context.root
-        user = context.user
-        paths = [ x for x in ids
-                  if root.is_allowed_to_move(user, resource.get_resource(x)) ]
+        paths = get_allowed_names(resource, context, ids, 'move')
 
         # Build the namespace
         paths.sort()
@@ -542,16 +557,14 @@ class Folder_BrowseContent(BrowseForm):
         removed = []
         referenced = []
         not_removed = []
-        user = context.user
-        root = context.root
+        allowed = set(get_allowed_names(resource, context, ids, 'remove'))
 
         # We sort and reverse ids in order to
         # remove the childs then their parents
         ids.sort()
         ids.reverse()
         for name in ids:
-            child = resource.get_resource(name)
-            if root.is_allowed_to_remove(user, child):
+            if name in allowed:
                 # Remove resource
                 try:
                     resource.del_resource(name)
@@ -589,10 +602,7 @@ class Folder_BrowseContent(BrowseForm):
     def action_rename(self, resource, context, form):
         ids = form['ids']
         # Filter names which the authenticated user is not allowed to move
-        root = context.root
-        user = context.user
-        paths = [ x for x in ids
-                  if root.is_allowed_to_move(user, resource.get_resource(x)) ]
+        paths = get_allowed_names(resource, context, ids, 'move')
 
         # Check input data
         if not paths:
@@ -611,10 +621,7 @@ class Folder_BrowseContent(BrowseForm):
     def action_copy(self, resource, context, form):
         ids = form['ids']
         # Filter names which the authenticated user is not allowed to copy
-        root = context.root
-        user = context.user
-        names = [ x for x in ids
-                  if root.is_allowed_to_copy(user, resource.get_resource(x)) ]
+        names = get_allowed_names(resource, context, ids, 'copy')
 
         # Check input data
         if not names:
@@ -632,10 +639,7 @@ class Folder_BrowseContent(BrowseForm):
     def action_cut(self, resource, context, form):
         ids = form['ids']
         # Filter names which the authenticated user is not allowed to move
-        root = context.root
-        user = context.user
-        names = [ x for x in ids
-                  if root.is_allowed_to_move(user, resource.get_resource(x)) ]
+        names = get_allowed_names(resource, context, ids, 'move')
 
         # Check input data
         if not names:
@@ -734,15 +738,42 @@ class Folder_PreviewContent(Folder_BrowseContent):
 
 
     def get_query_schema(self):
-        # Define a huge batch limit, and the image size parameter
+        # The batch size (the next pages are loaded while scrolling, see
+        # Folder_PreviewContent_JSON), and the image size parameter
         schema = super(Folder_PreviewContent, self).get_query_schema()
         return merge_dicts(schema,
-                           batch_size=Integer(default=0),
+                           batch_size=Integer(default=50),
                            size=Integer(default=128),
                            width=String,
                            height=String)
 
 
+    def get_scripts(self, context):
+        scripts = super(Folder_PreviewContent, self).get_scripts(context)
+        return scripts + ['/ui/gallery/gallery.js']
+
+
+    def get_size(self, resource, context):
+        size = context.query['size']
+        min_size = resource.SIZE_STEPS[0]
+        max_size = resource.SIZE_STEPS[-1]
+        return max(min_size, min(size, max_size))
+
+
+    def get_next_page(self, context, items):
+        """Returns the URL of the next page, in JSON, or None if this is
+        the last page.
+        """
+        start = context.query['batch_start']
+        size = context.query['batch_size']
+        if not size or len(items) < size:
+            return None
+
+        query = dict(context.uri.query)
+        query['batch_start'] = str(start + size)
+        return ';preview_content_json?%s' % encode_query(query)
+
+
     # Table
     table_template = '/ui/folder/browse_image.xml'
 
@@ -795,10 +826,7 @@ class Folder_PreviewContent(Folder_BrowseContent):
         height = query['height']
 
         # (0) Zoom
-        current_size = query['size']
-        min_size = resource.SIZE_STEPS[0]
-        max_size = resource.SIZE_STEPS[-1]
-        current_size = max(min_size, min(current_size, max_size))
+        current_size = self.get_size(resource, context)
 
         # (1) Actions (submit buttons)
         self._items = items
@@ -809,11 +837,16 @@ class Folder_PreviewContent(Folder_BrowseContent):
 
         # (3) Table Body: rows
         columns = self._get_table_columns(resource, context)
+        image_sizes = get_image_sizes(context, items)
         rows = []
         for item in items:
             row = {'checkbox': False,
                    # These are required for internal use
-                   'title_or_name': item.get_title()}
+                   'title_or_name': item.get_title(),
+                   'image_size': None}
+            image_size = image_sizes.get(str(item.abspath))
+            if image_size:
+                row['image_size'] = u'%d × %d' % image_size
             # XXX Already hard-coded in the catalog search
             row['is_folder'] = (item.class_id == 'folder')
             for name, title, sortable, css in columns:
@@ -838,6 +871,7 @@ class Folder_PreviewContent(Folder_BrowseContent):
 
         return {
             'root': resource.parent is None,
+            'next': self.get_next_page(context, items),
             'size': current_size,
             'width': width,
             'height': height,
@@ -848,6 +882,38 @@ class Folder_PreviewContent(Folder_BrowseContent):
 
 
 
+class Folder_PreviewContent_JSON(Folder_PreviewContent):
+    """Returns a page of the gallery, in JSON, to be added to the gallery
+    while scrolling (see /ui/gallery/gallery.js).
+    """
+
+    def GET(self, resource, context):
+        results = self.get_items(resource, context)
+        items = self.sort_and_batch(resource, context, results)
+        image_sizes = get_image_sizes(context, items)
+        size = self.get_size(resource, context)
+        thumb = ';thumb?width=%d&height=%d&fit=1&lossy=0' % (size, size)
+
+        images = []
+        for item in items:
+            name = str(resource.abspath.get_pathto(item.abspath))
+            width, height = image_sizes.get(str(item.abspath), (None, None))
+            view = item.get_view(None)
+            images.append({
+                'name': name,
+                'title': item.get_title(),
+                'href': '%s/' % context.get_link(item) if view else None,
+                'thumb': '%s/%s' % (name, thumb),
+                'width': width,
+                'height': height,
+                'is_folder': item.class_id == 'folder'})
+
+        context.set_content_type('application/json')
+        return dumps({'images': images,
+                      'next': self.get_next_page(context, items)})
+
+
+
 class Folder_Thumbnail(BaseView):
 
     access = True
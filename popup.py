@@ -35,7 +35,7 @@ from buttons import AddButton
 from datatypes import FileDataType
 from folder_views import Folder_BrowseContent
 import messages
-from utils import reduce_string, make_stl_template
+from utils import get_image_sizes, reduce_string, make_stl_template
 
 
 class SelectElement(AddButton):
@@ -142,6 +142,19 @@ class AddImage_BrowseContent(AddBase_BrowseContent):
 
     base_classes = ('folder', 'image')
 
+    table_columns = [
+        ('checkbox', None),
+        ('icon', None),
+        ('name', MSG(u'Name')),
+        ('image_size', MSG(u'Size'), False),
+        ('mtime', MSG(u'Last Modified')),
+        ('last_author', MSG(u'Last Author'))]
+
+
+    @proto_lazy_property
+    def image_sizes(self):
+        return get_image_sizes(self.context, self._items)
+
 
     def get_item_value(self, resource, context, item, column):
         if column == 'checkbox':
@@ -162,6 +175,11 @@ class AddImage_BrowseContent(AddBase_BrowseContent):
                     path_to_resource = Path(str(path) + '/')
                     path_to_icon = path_to_resource.resolve(path_to_icon)
             return path_to_icon
+        elif column == 'image_size':
+            image_size = self.image_sizes.get(str(item.abspath))
+            if image_size is None:
+                return None
+            return u'%d × %d' % image_size
         else:
             proxy = super(AddImage_BrowseContent, self)
             return proxy.get_item_value(resource, context, item, column)
@@ -0,0 +1,190 @@
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2012 Sylvain Taverne <sylvain@itaapy.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from multiprocessing import Pool, TimeoutError
+from time import time
+
+# Import from itools
+from itools.log import log_warning
+
+
+"""This module defines the pool of processes where the images are resized,
+so the server process does not decode big images itself.
+"""
+
+
+class ResizeBusy(StandardError):
+    """Raised when the pool is saturated, or the image is not resized yet.
+    The client should try again later.
+    """
+    pass
+
+
+
+def make_thumbnail(cls, data, *args):
+    """Run by the pool processes.
+    """
+    handler = cls(string=data)
+    return handler.get_thumbnail(*args)
+
+
+
+class ResizePool(object):
+
+    def __init__(self, size, queue_max, timeout):
+        self.size = size
+        self.queue_max = queue_max
+        # The timeout is given in milliseconds
+        self.timeout = timeout / 1000.0
+        self.pool = None
+        # Jobs not done yet, or done but not collected yet: the key is mapped
+        # to the tuple (job, start time)
+        self.pending = {}
+        self.anonymous = []
+        # Stats
+        self.done = 0
+        self.busy = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+
+    def start(self):
+        self.pool = Pool(self.size)
+
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+    def restart(self):
+        """Start the pool again, when a job runs longer than the timeout (its
+        process is likely stuck).  The other jobs are lost too, they will be
+        submitted again when the thumbnails are asked again.
+        """
+        log_warning('Resize pool restarted', domain='ikaaro')
+        self.stop()
+        self.pending.clear()
+        self.anonymous = []
+        self.start()
+
+
+    def expire(self):
+        """Drop the jobs that run for longer than the timeout (and restart
+        the pool), so they do not keep their slot of the queue forever.
+        """
+        limit = time() - self.timeout
+        expired = [ key for key, (job, t0) in self.pending.items()
+                    if t0 < limit and not job.ready() ]
+        if expired:
+            self.timeouts += len(expired)
+            self.restart()
+
+
+    def submit(self, key, handler, *args):
+        """Starts to make the thumbnail in the background, and returns the
+        job (an AsyncResult).  If the key is given, the same job is returned
+        while it is not collected.
+        """
+        self.expire()
+        if key is not None and key in self.pending:
+            return self.pending[key][0]
+
+        # Saturated
+        if len(self.pending) + len(self.anonymous) >= self.queue_max:
+            self.rejected += 1
+            raise ResizeBusy
+
+        args = (handler.__class__, handler.to_str()) + args
+        job = self.pool.apply_async(make_thumbnail, args)
+        if key is None:
+            self.anonymous.append(job)
+        else:
+            self.pending[key] = (job, time())
+        return job
+
+
+    def get_thumbnail(self, key, handler, *args):
+        """Returns the thumbnail if the pool has made it already, otherwise
+        starts to make it and raises ResizeBusy right away (the server loop
+        must not wait).  The thumbnail is then collected by the key, see
+        'collect'.
+        """
+        job = self.submit(key, handler, *args)
+        if not job.ready():
+            self.busy += 1
+            raise ResizeBusy
+
+        del self.pending[key]
+        self.done += 1
+        return job.get()
+
+
+    def resize(self, handler, *args):
+        """Makes the thumbnail in the pool, waiting up to the timeout (used
+        to reduce the images uploaded).  If the pool is saturated, or the
+        timeout is reached, it is made here.
+        """
+        try:
+            job = self.submit(None, handler, *args)
+        except ResizeBusy:
+            return handler.get_thumbnail(*args)
+
+        try:
+            return job.get(self.timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            self.restart()
+            return handler.get_thumbnail(*args)
+        finally:
+            if job in self.anonymous:
+                self.anonymous.remove(job)
+
+
+    def collect(self):
+        """Returns the list of (key, value) of the jobs done in the
+        background, and forgets them.
+        """
+        self.expire()
+        self.anonymous = [ x for x in self.anonymous if not x.ready() ]
+
+        done = []
+        for key, (job, t0) in self.pending.items():
+            if not job.ready():
+                continue
+            del self.pending[key]
+            try:
+                value = job.get()
+            except Exception:
+                log_warning('Failed to make the thumbnail %s' % key,
+                            domain='ikaaro')
+                continue
+            done.append((key, value))
+            self.done += 1
+        return done
+
+
+    def get_stats(self):
+        return {
+            'processes': self.size,
+            'pending': len(self.pending) + len(self.anonymous),
+            'queue-max': self.queue_max,
+            'done': self.done,
+            'busy': self.busy,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts}
@@ -51,6 +51,7 @@ from resource_views import DBResource_Links, DBResource_Backlinks
 from resource_views import LoginView, LogoutView
 from resource_views import Put_View, Delete_View
 from resource_views import DBResource_GetFile, DBResource_GetImage
+from resource_views import CachedPage_View
 from rest import Rest_Login, Rest_Schema, Rest_Query
 from rest import Rest_Create, Rest_Read, Rest_Update, Rest_Delete
 from revisions_views import DBResource_CommitLog, DBResource_Changes
@@ -319,6 +320,14 @@ class DBResource(Resource):
 
 
     def get_view(self, name, query=None):
+        # The page was found in the page cache (see Root.before_traverse)
+        context = get_context()
+        page = getattr(context, 'cached_page', None)
+        if (page is not None and context.resource is self
+                and name == context.view_name):
+            context.cached_page = None
+            return CachedPage_View(resource=self, context=context, page=page)
+
         # To define a default view, override this
         if name is None:
             name = self.get_default_view_name()
@@ -328,7 +337,6 @@ class DBResource(Resource):
         # Explicit view, defined by name
         view = getattr(self, name, None)
         if is_prototype(view, BaseView):
-            context = get_context()
             view = view(resource=self, context=context) # bind
             return view
 
@@ -554,20 +562,21 @@ class DBResource(Resource):
         values['links'] = list(self.get_links())
         values['onchange_reindex'] = self.get_onchange_reindex()
 
-        # Full text
+        # Access (see ConfigAccess.get_readable_by)
         context = get_context()
         try:
             server = context.server
         except AttributeError:
             server = None
-        if server is not None and server.index_text:
-            try:
-                values['text'] = self.to_text()
-            except NotImplementedError:
-                pass
-            except Exception:
-                log = 'Indexation failed: %s' % abspath
-                log_warning(log, domain='ikaaro')
+        if server is not None and server.index_access:
+            access = context.root.get_resource('/config/access')
+            values['readable_by'] = access.get_readable_by(self)
+
+        # Full text (when deferred it is indexed later, see server.py)
+        if server is not None and server.index_text is True:
+            text = self.get_catalog_text()
+            if text is not None:
+                values['text'] = text
 
         # Time events
         reminder, payload = self.next_time_event()
@@ -578,6 +587,21 @@ class DBResource(Resource):
         return values
 
 
+    def get_catalog_text(self):
+        """Return the value to index in the full-text field, or None if
+        there is nothing to index.
+        """
+        try:
+            return self.to_text()
+        except NotImplementedError:
+            pass
+        except Exception:
+            log = 'Indexation failed: %s' % self.abspath
+            log_warning(log, domain='ikaaro')
+
+        return None
+
+
     def get_onchange_reindex(self):
         return None
 
@@ -867,6 +891,8 @@ register_field('base_classes', String(multiple=True, indexed=True))
 # Referential integrity
 register_field('links', String(multiple=True, indexed=True))
 register_field('onchange_reindex', String(multiple=True, indexed=True))
+# Access control
+register_field('readable_by', String(multiple=True, indexed=True))
 # Full text search
 register_field('text', Unicode(indexed=True))
 # Various classifications
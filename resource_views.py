@@ -37,6 +37,8 @@ from emails import send_email
 from exceptions import ConsistencyError
 from folder_views import Folder_BrowseContent
 from messages import MSG_LOGIN_WRONG_NAME_OR_PASSWORD
+from resize import ResizeBusy
+from utils import check_etag, get_etag, get_thumbnail, set_cache_control
 
 
 
@@ -71,6 +73,8 @@ class DBResource_GetFile(BaseView):
 
     query_schema = {'name': String}
     field_name = None
+    # Cache-Control (in seconds)
+    cache_max_age = 0
 
 
     def get_field_name(self, context=None):
@@ -85,12 +89,21 @@ class DBResource_GetFile(BaseView):
         return resource.get_value(name)
 
 
+    def get_etag(self, resource, handler):
+        # The query is there for the thumbnails (width, height, etc.)
+        query = sorted(get_context().uri.query.items())
+        return get_etag(resource.abspath, self.get_field_name(),
+                        resource.get_value('mtime'), handler.get_mtime(),
+                        query)
+
+
     def get_mtime(self, resource):
         field_name = self.get_field_name()
         handler = self.get_handler(resource, field_name)
         if handler is None:
             raise NotFound
-        return handler.get_mtime()
+        etag = self.get_etag(resource, handler)
+        return check_etag(get_context(), etag, handler.get_mtime())
 
 
     def get_content_type(self, handler):
@@ -122,8 +135,98 @@ class DBResource_GetFile(BaseView):
         filename = self.get_filename(handler, field_name, resource)
         context.set_content_disposition(disposition, filename)
 
-        # Ok
-        return handler.to_str()
+        # Cache-Control
+        set_cache_control(context, resource, self.cache_max_age)
+
+        # Range
+        context.set_header('Accept-Ranges', 'bytes')
+        size = self.get_data_size(handler)
+        byte_range = self.get_range(resource, handler, context, size)
+        if byte_range is None:
+            return self.get_data(handler)
+
+        # Range Not Satisfiable
+        if byte_range is False:
+            context.status = 416
+            context.set_header('Content-Range', 'bytes */%d' % size)
+            return ''
+
+        # Partial Content
+        start, end = byte_range
+        context.status = 206
+        context.set_header('Content-Range',
+                           'bytes %d-%d/%d' % (start, end, size))
+        return self.get_data(handler, start, end - start + 1)
+
+
+    def get_range(self, resource, handler, context, size):
+        """Returns the (first, last) bytes asked by the Range header, None to
+        send the whole data, or False if the range cannot be satisfied.  Only
+        single ranges are supported.
+        """
+        value = context.get_header('Range')
+        if not value or not value.startswith('bytes=') or ',' in value:
+            return None
+
+        # If-Range (the dates are not supported, send the whole data)
+        if_range = context.get_header('If-Range')
+        if if_range and if_range != self.get_etag(resource, handler):
+            return None
+
+        # bytes=first-last, bytes=first-, bytes=-suffix
+        first, last = value[6:].split('-', 1)
+        try:
+            if first:
+                first = int(first)
+                last = int(last) if last else size - 1
+            else:
+                first = max(size - int(last), 0)
+                last = size - 1
+        except ValueError:
+            return None
+        if first > last or first >= size:
+            return False
+        return first, min(last, size - 1)
+
+
+    def get_data_key(self, handler):
+        """Returns the key of the file to read the data of the handler from,
+        or None if it must be taken from the handler (it is changed, or new).
+        Then the data is not loaded (and kept) in the database cache.
+        """
+        fs = get_context().database.fs
+        key = handler.key
+        if handler.dirty is None and key and fs.is_file(key):
+            return key
+        return None
+
+
+    def get_data_size(self, handler):
+        key = self.get_data_key(handler)
+        if key is None:
+            return len(handler.to_str())
+        return get_context().database.fs.get_size(key)
+
+
+    def get_data(self, handler, start=0, size=None):
+        """Returns the data of the handler, or the given slice.  Only the
+        slice is read from the file, so a player reading a video by ranges
+        only reads the ranges.  The whole data is read for a full download
+        (itools.web sends the body at once, it cannot stream a file).
+        """
+        key = self.get_data_key(handler)
+        if key is not None:
+            file = get_context().database.fs.open(key)
+            try:
+                file.seek(start)
+                return file.read() if size is None else file.read(size)
+            finally:
+                file.close()
+
+        data = handler.to_str()
+        if size is None:
+            return data[start:]
+        return data[start:start + size]
 
 
 
@@ -137,20 +240,39 @@ class DBResource_GetImage(DBResource_GetFile):
         'lossy': Boolean(default=False)}
 
 
+    def get_image_size(self, resource, handler):
+        # The size of the images is in the catalog (see Image)
+        if self.get_field_name() == 'data':
+            get_image_size = getattr(resource, 'get_image_size', None)
+            if get_image_size is not None:
+                return get_image_size()
+        return handler.get_size()
+
+
     def GET(self, resource, context):
         field_name = self.get_field_name(context)
         handler = self.get_handler(resource, field_name)
 
-        image_width, image_height = handler.get_size()
         fit = context.query['fit']
         lossy = context.query['lossy']
-        width = context.query['width'] or image_width
-        height = context.query['height'] or image_height
+        width = context.query['width']
+        height = context.query['height']
+        if not width or not height:
+            image_width, image_height = self.get_image_size(resource, handler)
+            width = width or image_width
+            height = height or image_height
 
         format = 'jpeg'
         if lossy is False:
             format = handler.get_mimetype().split('/')[1]
-        data, format = handler.get_thumbnail(width, height, format, fit)
+        try:
+            data, format = get_thumbnail(handler, width, height, format, fit)
+        except ResizeBusy:
+            # Try again later
+            context.status = 503
+            context.set_header('Retry-After', '2')
+            context.set_header('Cache-Control', 'no-store')
+            data = None
         if data is None:
             default = context.get_template('/ui/icons/48x48/image.png')
             data = default.to_str()
@@ -158,6 +280,8 @@ class DBResource_GetImage(DBResource_GetFile):
 
         # Headers
         context.set_content_type('image/%s' % format)
+        if context.status != 503:
+            set_cache_control(context, resource, self.cache_max_age)
 #       filename = resource.get_value('filename')
 #       if filename:
 #           context.set_content_disposition('inline', filename)
@@ -209,6 +333,21 @@ class DBResource_Backlinks(DBResource_Links):
 
 
 
+class CachedPage_View(BaseView):
+    """Serves a page from the page cache (see Root.before_traverse).
+    """
+
+    access = True
+    page_cache = False
+    page = None
+
+    def GET(self, resource, context):
+        content_type, body = self.page
+        context.content_type = content_type
+        return body
+
+
+
 ###########################################################################
 # Views / Login, Logout
 ###########################################################################
@@ -218,6 +357,7 @@ class LoginView(STLView):
     title = MSG(u'Login')
     template = '/ui/base/login.xml'
     meta = [('robots', 'noindex, follow', None)]
+    page_cache = False
 
     query_schema = {
         'loginname': String,
@@ -28,7 +28,8 @@ from itools.web import BaseView
 # Import from ikaaro
 from fields import Metadata_Field, File_Field
 from resource_views import LoginView
-from utils import get_base_path_query
+from utils import check_etag, get_base_path_query, get_etag
+from utils import set_cache_control
 
 
 ###########################################################################
@@ -181,6 +182,16 @@ class Rest_Read(Rest_BaseView):
 
     access = 'is_allowed_to_view'
 
+    def get_mtime(self, resource):
+        # The fields returned depend on the user
+        context = self.context
+        mtime = resource.get_value('mtime')
+        user = context.user
+        user = user.abspath if user else None
+        etag = get_etag(resource.abspath, mtime, user)
+        return check_etag(context, etag, mtime)
+
+
     def GET(self, resource, context):
         # Build a dictionary represeting the resource by its schema.
         representation = {}
@@ -193,6 +204,8 @@ class Rest_Read(Rest_BaseView):
         # Set last modification time
         mtime = resource.get_value('mtime')
         context.set_header('Last-Modified', mtime)
+        # The fields returned depend on the user (see field_to_json)
+        set_cache_control(context, resource, per_user=True)
         # Ok
         return self.return_json(representation)
 
@@ -28,6 +28,7 @@ from email.MIMEMultipart import MIMEMultipart
 from email.Utils import formatdate
 from email.header import Header
 from json import dumps
+from os import getpid
 import sys
 import traceback
 
@@ -37,7 +38,7 @@ from itools.database import RWDatabase
 from itools.gettext import MSG
 from itools.handlers import ConfigFile, ro_database
 from itools.html import stream_to_str_as_html, xhtml_doctype
-from itools.log import log_warning
+from itools.log import log_debug, log_warning
 from itools.stl import stl
 from itools.uri import Path
 from itools.web import BaseView, get_context
@@ -75,9 +76,29 @@ class CtrlView(BaseView):
     def GET(self, resource, context):
         context.content_type = 'text/plain'
         database = context.database
+        server = context.server
+        text_cache = server.text_cache
+        page_cache = server.page_cache
+        thumbnail_cache = server.thumbnail_cache
+        resize_pool = server.resize_pool
+        commit_stats = getattr(database, 'commit_stats', None)
+        workers = server.workers
         return dumps(
             {'packages': resource.get_version_of_packages(context),
-             'read-only': not isinstance(database, RWDatabase)})
+             'read-only': not isinstance(database, RWDatabase),
+             'text-queue': server.text_queue.get_size(),
+             'access-queue': server.access_queue.get_size(),
+             'text-cache': text_cache.get_stats() if text_cache else None,
+             'page-cache': page_cache.get_stats() if page_cache else None,
+             'thumbnail-cache': (thumbnail_cache.get_stats()
+                                 if thumbnail_cache else None),
+             'resize-pool': resize_pool.get_stats() if resize_pool else None,
+             'commits': commit_stats.get_stats() if commit_stats else None,
+             'replica': server.replica,
+             'head': getattr(database, 'head', None),
+             'pid': getpid(),
+             'cache': database.get_cache_stats(),
+             'workers': workers.get_stats() if workers else None})
 
 
 
@@ -211,6 +232,21 @@ class Root(Folder):
         if language is not None and language != '':
             accept.set(language, 2.5)
 
+        # Page cache (anonymous users only)
+        context.page_cache_key = None
+        context.cached_page = None
+        page_cache = context.server.page_cache
+        if page_cache is None or context.method != 'GET' or user is not None:
+            return
+        if 'language' in context.uri.query:
+            return
+        languages = self.get_value('website_languages')
+        language = accept.select_language(languages)
+        skin = self.get_skin(context)
+        key = (str(context.uri), language, skin.key)
+        context.page_cache_key = key
+        context.cached_page = page_cache.get(key)
+
 
     def get_skin(self, context):
         # Open in fancybox ?
@@ -226,6 +262,17 @@ class Root(Folder):
 
 
     def after_traverse(self, context):
+        try:
+            self._after_traverse(context)
+            self._set_cached_page(context)
+        finally:
+            log = 'Permissions memo: %d hits, %d misses (%s)'
+            log = log % (context.permissions_hits,
+                         context.permissions_misses, context.uri)
+            log_debug(log, domain='ikaaro')
+
+
+    def _after_traverse(self, context):
         body = context.entity
         is_str = type(body) is str
         is_xml = is_xml_stream(body)
@@ -245,6 +292,26 @@ class Root(Folder):
         context.content_type = 'text/html; charset=UTF-8'
 
 
+    def _set_cached_page(self, context):
+        key = getattr(context, 'page_cache_key', None)
+        if key is None:
+            return
+        view = context.view
+        if view is None or not getattr(view, 'page_cache', True):
+            return
+        if context.status not in (None, 200) or context.user is not None:
+            return
+        content_type = context.content_type
+        if not content_type or not content_type.startswith('text/html'):
+            return
+        if type(context.entity) is not str:
+            return
+
+        page_cache = context.server.page_cache
+        path = str(context.resource.abspath)
+        page_cache.set(key, path, content_type, context.entity)
+
+
     def get_available_languages(self):
         """Returns the language codes for the user interface.
         """
@@ -469,8 +536,27 @@ class Root(Folder):
     def has_permission(self, user, permission, resource, class_id=None):
         if resource is None:
             return False
+
+        # Look first in the memo of the request
+        context = get_context()
+        key = (str(user.abspath) if user else None, permission,
+               str(resource.abspath), class_id)
+        value = context.get_cached_permission(key)
+        if value is not None:
+            return value
+
         access = self.get_resource('config/access')
-        return access.has_permission(user, permission, resource, class_id)
+        value = access.has_permission(user, permission, resource, class_id)
+        context.set_cached_permission(key, value)
+        return value
+
+
+    def has_permissions(self, user, permission, resources, class_id=None):
+        """Like 'has_permission' but for a list of resources, return the
+        ones the user has the permission on.
+        """
+        access = self.get_resource('config/access')
+        return access.has_permissions(user, permission, resources, class_id)
 
 
     def is_allowed_to_view(self, user, resource):
@@ -507,6 +593,29 @@ class Root(Folder):
         return self.has_permission(user, 'edit', resource)
 
 
+    # The same for a list of resources, return the ones the user is allowed
+    # to remove, copy or move.  Only one search is done, unless the method
+    # for one resource is overridden.
+    def _get_allowed_to(self, name, user, resources):
+        name = 'is_allowed_to_%s' % name
+        method = getattr(self, name)
+        if method.im_func is getattr(Root, name).im_func:
+            return self.has_permissions(user, 'edit', resources)
+        return [ x for x in resources if method(user, x) ]
+
+
+    def get_allowed_to_remove(self, user, resources):
+        return self._get_allowed_to('remove', user, resources)
+
+
+    def get_allowed_to_copy(self, user, resources):
+        return self._get_allowed_to('copy', user, resources)
+
+
+    def get_allowed_to_move(self, user, resources):
+        return self._get_allowed_to('move', user, resources)
+
+
     def get_user(self, name):
         return self.get_resource('users/%s' % name, soft=True)
 
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2012 Sylvain Taverne <sylvain@itaapy.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from optparse import OptionParser
+from sys import exit
+
+# Import from itools
+from itools import __version__
+
+# Import from ikaaro
+from ikaaro.server import Server, get_pid
+
+
+def index_text(parser, options, target):
+    # Check the server is not running
+    pid = get_pid('%s/pid' % target)
+    if pid is not None:
+        print 'The server is running. Stop it before running this command.'
+        return 1
+
+    # Index the whole queue
+    server = Server(target)
+    size = server.text_queue.get_size()
+    if size == 0:
+        print 'There is nothing to index.'
+        return 0
+
+    print 'Index the full-text of %d resources (may take a while)' % size
+    server.index_text_queue()
+
+    # Ok
+    return 0
+
+
+
+if __name__ == '__main__':
+    # The command line parser
+    usage = '%prog TARGET'
+    version = 'itools %s' % __version__
+    description = (
+        'Indexes the full-text of the resources still in the queue, when the '
+        'TARGET instance is configured with "index-text = deferred".')
+    parser = OptionParser(usage, version=version, description=description)
+
+    # Parse arguments
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('incorrect number of arguments')
+
+    # Ok
+    target = args[0]
+    ret = index_text(parser, options, target)
+    exit(ret)
@@ -93,11 +93,95 @@ session-timeout = 0
 database-size = 19500:20500
 database-readonly = 0
 
+# If "database-memory-budget" is set (e.g. 2G), the limits of the database
+# cache are adapted regularly so the memory it uses goes towards the budget;
+# then "database-size" only gives the initial limits.
+#
+database-memory-budget =
+
 # The "index-text" variable defines whether the catalog must process full-text
 # indexing. It requires (much) more time and third-party applications.
 # To speed up catalog updates, set this option to 0 (default is 1).
+# With "deferred" the full-text is indexed in the background, after the
+# commit, by batches of "index-text-batch" resources (the queue is kept in
+# the "text-queue" file and can be flushed with icms-index-text.py).
 #
 index-text = 1
+index-text-batch = 50
+
+# If "index-access" is set to 1, the 'view' access of every resource is
+# computed when it is indexed, so searches are faster; but then every
+# resource is indexed again (in the background) when an access rule changes.
+# To switch it on the catalog must be rebuilt (icms-update-catalog.py).
+# Default is 0.
+#
+index-access = 0
+
+# If "text-cache-size" is set (e.g. 100M), the text extracted from files (PDF,
+# office documents, etc.) is kept in the "cache/text" folder, up to this size,
+# so it is not extracted again when the file did not change (for instance
+# when the catalog is rebuilt).  By default there is no cache.
+#
+text-cache-size =
+
+# If "page-cache-size" is set (e.g. 64M), the pages served to anonymous users
+# are kept in memory, up to this size, and served again until a commit
+# changes the resource (or its parents, or the configuration).
+#
+page-cache-size =
+
+# If "thumbnail-cache-size" is set (e.g. 1G), the thumbnails of the images are
+# kept in the "cache/thumbnails" folder, up to this size.
+#
+thumbnail-cache-size =
+
+# If "resize-workers" is not zero, the images are resized by a pool of this
+# number of processes (it requires the thumbnail cache).  No more than
+# "resize-queue" images are resized at the same time.  A request for a
+# thumbnail not made yet gets a "503 Service Unavailable" answer (with a
+# Retry-After header), and the thumbnail is put in the cache when ready.  The
+# thumbnails of the standard sizes are then made when an image is uploaded.
+# An image not resized within "resize-timeout" milliseconds is dropped (and
+# the pool is restarted); an upload is then reduced by the server itself.
+#
+resize-workers = 0
+resize-queue = 20
+resize-timeout = 10000
+
+# The files bigger than "large-file-size" (default is 10M) are dropped from
+# the database cache once saved, so the uploads do not stay in memory.
+#
+large-file-size = 10M
+
+# The commits that take longer than "slow-commit-threshold" milliseconds are
+# logged to the "log/slow-commits" file, with the time spent by every phase
+# of the commit (default is 1000, zero to disable).
+#
+slow-commit-threshold = 1000
+
+# If "group-commit-window" is set (in milliseconds), the write requests
+# arriving within that window are grouped in a single Git commit and catalog
+# save (at most "group-commit-max" requests), the author and message of every
+# request are kept in the commit message.  This is faster under heavy write
+# load, but if the server is killed the last window is not committed (the
+# files are written, so "git status" shows them).  Default is 0 (disabled).
+#
+group-commit-window = 0
+group-commit-max = 50
+
+# The read-only replicas (started with "icms-start.py --replica --port N")
+# look for new commits every "replica-interval" seconds (default is 1).
+#
+replica-interval = 1
+
+# The "index-workers" variable defines the number of worker processes used
+# to compute the catalog values of the resources changed by a commit, when
+# there are at least "index-workers-threshold" of them (for instance when
+# extracting a big archive).  If zero (the default) everything is done by the
+# server process.
+#
+index-workers = 0
+index-workers-threshold = 200
 
 # The size of images can be controlled by setting the following values.
 # (ie. max-width = 1280) (by default it is None, keeping original size).
@@ -19,8 +19,14 @@
 
 # Import from the Standard Library
 from optparse import OptionParser
+from os.path import abspath
+from signal import signal, SIGHUP
+import sys
 from sys import exit
 
+# Import from pygobject
+from glib import timeout_add
+
 # Import from itools
 from itools import __version__
 from itools.core import become_daemon
@@ -28,13 +34,20 @@ from itools.database import check_database
 from itools.loop import Loop, cron
 
 # Import from ikaaro
+from ikaaro.database import recover_group_commit
 from ikaaro.update import is_instance_up_to_date
-from ikaaro.server import Server, CMSContext, get_pid
+from ikaaro.server import Server, CMSContext, Workers, get_pid
 
 
 def start(options, target):
-    # Check the server is not running
-    pid = get_pid('%s/pid' % target)
+    # Check the server is not running (replicas have their own pid file)
+    pid_file = '%s/pid' % target
+    if options.replica:
+        if options.port is None:
+            print '[%s] The replica needs its own port (--port).' % target
+            return 1
+        pid_file = '%s/pid-%s' % (target, options.port)
+    pid = get_pid(pid_file)
     if pid is not None:
         print '[%s] The Web Server is already running.' % target
         return 1
@@ -45,8 +58,16 @@ def start(options, target):
                'icms-stop.py to stop it.') % target
         return 1
 
-    # Check for database consistency
-    if options.quick is False and check_database(target) is False:
+    # Commit the changes of a group commit not flushed (the server stopped)
+    read_only = options.read_only or options.replica
+    recovered = False
+    if not read_only:
+        recovered = recover_group_commit(target)
+
+    # Check for database consistency (the replicas leave this to the
+    # server that writes)
+    quick = options.quick or options.replica
+    if quick is False and check_database(target) is False:
         return 1
 
     # Check instance is up to date
@@ -63,7 +84,11 @@ def start(options, target):
 
     # Set-up the server
     server = Server(target, read_only=options.read_only,
-                    profile_space=options.profile_space)
+                    profile_space=options.profile_space,
+                    replica=options.replica)
+
+    if recovered:
+        server.reindex_group_commit()
 
     # Update Git tree-cache, to speed things up
     server.database.worktree.update_tree_cache()
@@ -77,22 +102,74 @@ def start(options, target):
         address = None
 
     # Find out the port to listen
-    port = config.get_value('listen-port')
+    port = options.port or config.get_value('listen-port')
     if port is None:
         raise ValueError, 'listen-port is missing from config.conf'
 
+    # The resize pool (started before listening, its processes are forked).
+    # The thumbnails made in the background are kept in the thumbnail cache
+    if config.get_value('resize-workers'):
+        if server.thumbnail_cache is None:
+            print ('[%s] The resize pool requires the thumbnail cache '
+                   '(thumbnail-cache-size).') % target
+            return 1
+        server.start_resize_pool()
+        cron(server.resize_manager, 1)
+
     server.listen(address, port)
     server.set_context('/', CMSContext)
     interval = config.get_value('cron-interval')
     if interval:
         cron(server.cron_manager, 1)
+    if server.index_text == 'deferred' and not server.read_only:
+        cron(server.text_queue_manager, 1)
+    if server.index_access and not server.read_only:
+        cron(server.access_queue_manager, 1)
+    if server.group_commit_window:
+        timeout_add(server.group_commit_window, server.group_commit_manager)
+    if server.replica:
+        cron(server.replica_manager, 1)
+    if config.get_value('database-memory-budget'):
+        cron(server.cache_manager, 60)
+
+    # Prefork: the read-only workers listen to the next ports, the reverse
+    # proxy in front sends them the GET/HEAD requests
+    if options.workers and not server.read_only:
+        command = [sys.executable, abspath(sys.argv[0])]
+        workers = Workers(command, target, port, options.workers)
+        server.workers = workers
+        workers.start()
+        cron(workers.manager, 1)
+        # Graceful restart of the workers (icms-stop.py --restart)
+        def restart(signum, frame):
+            workers.restart = True
+        signal(SIGHUP, restart)
 
     # Run
     profile = options.profile_time
     profile = ('%s/log/profile' % target) if profile else None
-    loop = Loop(pid_file='%s/pid' % target, profile=profile)
+    loop = Loop(pid_file=pid_file, profile=profile)
     loop.run()
 
+    # Commit what is left (group commit)
+    if server.group_commit_window:
+        server.database.flush_commits()
+    # Check the 'onchange_reindex' relation kept in memory along the run
+    if not server.read_only and not options.quick:
+        if not server.database.check_reverse_dependencies():
+            print ('[%s] The onchange_reindex relation does not match the '
+                   'catalog (see log/events), please type:') % target
+            print
+            print '    $ icms-update-catalog.py %s' % target
+            print
+    # Stop the resize pool
+    if server.resize_pool:
+        server.resize_pool.stop()
+
+    # Stop the workers
+    if server.workers:
+        server.workers.stop()
+
     # Ok
     return 0
 
@@ -111,6 +188,17 @@ if __name__ == '__main__':
     parser.add_option(
         '-r', '--read-only', action="store_true", default=False,
         help="Start the server in read-only mode.")
+    parser.add_option(
+        '--replica', action="store_true", default=False,
+        help="Start a read-only server that follows the commits of the main"
+             " server (it must listen to another port).")
+    parser.add_option(
+        '-p', '--port', type='int',
+        help="Listen to this port instead of the one in config.conf.")
+    parser.add_option(
+        '-w', '--workers', type='int', default=0,
+        help="Start also this number of read-only replicas, listening to the"
+             " next ports.")
     parser.add_option(
         '--quick', action="store_true", default=False,
         help="Do not check the database consistency.")
@@ -20,7 +20,7 @@
 # Import from the Standard Library
 from optparse import OptionParser
 from os import kill
-from signal import SIGINT, SIGTERM
+from signal import SIGHUP, SIGINT, SIGTERM
 
 # Import from itools
 import itools
@@ -31,8 +31,11 @@ from ikaaro.server import get_pid
 
 
 def stop(parser, options, target):
-    # Stop the Web Server
-    pid = get_pid('%s/pid' % target)
+    # Stop the Web Server (or a replica)
+    pid_file = '%s/pid' % target
+    if options.port is not None:
+        pid_file = '%s/pid-%s' % (target, options.port)
+    pid = get_pid(pid_file)
     if pid is None:
         print '[%s] Web Server not running.' % target
 
@@ -42,6 +45,9 @@ def stop(parser, options, target):
         if sub_pid is not None:
             kill(sub_pid, SIGTERM)
             print '[%s] Web Server subprocess is running, i kill it' % target
+    elif options.restart:
+        kill(pid, SIGHUP)
+        print '[%s] Web Server workers restarting (gracefully)...' % target
     else:
         signal = SIGTERM if options.force else SIGINT
         kill(pid, signal)
@@ -62,6 +68,12 @@ if __name__ == '__main__':
     parser.add_option(
         '--force', action="store_true", default=False,
         help="Emits SIGTERM instead of SIGINT signal.")
+    parser.add_option(
+        '-p', '--port', type='int',
+        help="Stop the replica listening to this port.")
+    parser.add_option(
+        '--restart', action="store_true", default=False,
+        help="Restart gracefully the workers started with --workers.")
 
     options, args = parser.parse_args()
     if len(args) == 0:
@@ -65,6 +65,9 @@ def update_catalog(parser, options, target):
     # Build a fake context
     context = get_fake_context(server.database)
     context.server = server
+    # The deferred full-text is indexed now, when rebuilding the catalog
+    if server.index_text == 'deferred':
+        server.index_text = True
 
     # Update
     t0, v0 = time(), vmsize()
@@ -116,6 +119,10 @@ def update_catalog(parser, options, target):
         if lfs.exists(old_catalog_path):
             lfs.remove(old_catalog_path)
         lfs.move(catalog_path, old_catalog_path)
+        # Nothing left to do for the deferred full-text indexing, nor for
+        # the access
+        server.text_queue.set_paths([])
+        server.access_queue.set_paths([])
         # Commit / Report
         t2, v2 = time(), vmsize()
         v = (v2 - v1)/1024
@@ -23,9 +23,11 @@ from datetime import timedelta
 from email.parser import HeaderParser
 import json
 import pickle
-from os import fdopen, getpgid
+from os import fdopen, getpgid, kill, rename
 from smtplib import SMTP, SMTPRecipientsRefused, SMTPResponseException
+from signal import SIGINT
 from socket import gaierror
+from subprocess import Popen
 import sys
 from tempfile import mkstemp
 from traceback import format_exc
@@ -48,10 +50,13 @@ from itools.web import StaticContext, set_context
 from itools.web import SoupMessage
 
 # Import from ikaaro
+from cache import DiskCache, PageCache
 from context import CMSContext
-from database import get_database
-from datatypes import ExpireValue
+from database import get_database, register_commit_listener
+from datatypes import DataSize, ExpireValue, IndexTextValue
+from resize import ResizePool
 from skins import skin_registry
+from utils import set_thumbnail
 
 
 log_levels = {
@@ -116,10 +121,178 @@ def get_fake_context(database):
 
 
 
+class TextQueue(object):
+    """The resources whose full-text is still to be indexed, when the
+    "index-text" option is "deferred".  The queue is kept in a plain text
+    file, one path per line, so it survives a restart.
+
+    Also used for the resources to reindex when the access rules change,
+    with the "index-access" option.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+    def get_paths(self):
+        if not lfs.exists(self.path):
+            return []
+
+        paths = []
+        seen = set()
+        for line in open(self.path):
+            path = line.strip()
+            if path and path not in seen:
+                seen.add(path)
+                paths.append(path)
+        return paths
+
+
+    def get_size(self):
+        return len(self.get_paths())
+
+
+    def is_empty(self):
+        return not lfs.exists(self.path) or lfs.get_size(self.path) == 0
+
+
+    def push(self, paths):
+        if not paths:
+            return
+
+        file = open(self.path, 'a')
+        try:
+            file.write(''.join([ '%s\n' % x for x in paths ]))
+        finally:
+            file.close()
+
+
+    def set_paths(self, paths):
+        tmp_path = '%s.tmp' % self.path
+        file = open(tmp_path, 'w')
+        try:
+            file.write(''.join([ '%s\n' % x for x in paths ]))
+        finally:
+            file.close()
+        rename(tmp_path, self.path)
+
+
+
+class Workers(object):
+    """The read-only replicas started and watched by the main server, with
+    the '--workers' option of icms-start.py.  Every worker listens to its
+    own port, the ports following the one of the main server.
+    """
+
+    def __init__(self, command, target, port, size):
+        # The command to start a replica (icms-start.py)
+        self.command = command
+        self.target = target
+        self.ports = range(port + 1, port + size + 1)
+        self.processes = {}
+        self.restarts = dict([ (x, 0) for x in self.ports ])
+        # Set by the SIGHUP handler, see icms-start.py
+        self.restart = False
+        # The graceful restart: the ports left, the worker being stopped,
+        # and the worker started and not yet listening
+        self.to_restart = []
+        self.stopping = None
+        self.starting = None
+
+
+    def spawn(self, port):
+        command = self.command + ['--replica', '--quick', '--port', str(port),
+                                  self.target]
+        self.processes[port] = Popen(command)
+
+
+    def is_ready(self, port):
+        """The pid file is written by the loop of the worker, once it
+        listens to its port.
+        """
+        pid = get_pid('%s/pid-%s' % (self.target, port))
+        return pid == self.processes[port].pid
+
+
+    def start(self):
+        for port in self.ports:
+            self.spawn(port)
+
+
+    def stop(self, port=None):
+        ports = self.ports if port is None else [port]
+        # Gracefully
+        for port in ports:
+            process = self.processes[port]
+            if process.poll() is None:
+                kill(process.pid, SIGINT)
+        for port in ports:
+            self.processes[port].wait()
+
+
+    def manager(self):
+        if self.restart:
+            self.restart = False
+            self.to_restart = list(self.ports)
+
+        # Start again the workers that died (but the one being stopped)
+        for port in self.ports:
+            if port == self.stopping:
+                continue
+            returncode = self.processes[port].poll()
+            if returncode is not None:
+                log_warning('Worker %d exited with %d, start it again' %
+                            (port, returncode))
+                self.spawn(port)
+                self.restarts[port] += 1
+
+        # Restart the workers one by one, so the others go on serving.  The
+        # loop is not blocked: wait for the worker to exit, then for the new
+        # one to listen, before going to the next
+        port = self.stopping
+        if port is not None:
+            if self.processes[port].poll() is None:
+                return 1
+            self.stopping = None
+            self.spawn(port)
+            self.restarts[port] += 1
+            self.starting = port
+
+        port = self.starting
+        if port is not None:
+            if not self.is_ready(port):
+                return 1
+            self.starting = None
+            if not self.to_restart:
+                log_info('Workers restarted')
+
+        if self.to_restart:
+            port = self.to_restart.pop(0)
+            process = self.processes[port]
+            if process.poll() is None:
+                kill(process.pid, SIGINT)
+            self.stopping = port
+
+        return 1
+
+
+    def get_stats(self):
+        stats = []
+        for port in self.ports:
+            process = self.processes[port]
+            stats.append({
+                'port': port,
+                'pid': process.pid,
+                'alive': process.poll() is None,
+                'restarts': self.restarts[port]})
+        return stats
+
+
+
 class Server(WebServer):
 
     def __init__(self, target, read_only=False, cache_size=None,
-                 profile_space=False):
+                 profile_space=False, replica=False):
         target = lfs.get_absolute_path(target)
         self.target = target
 
@@ -132,8 +305,31 @@ class Server(WebServer):
         self.smtp_from = config.get_value('smtp-from')
 
         # Full-text indexing
-        self.index_text =  config.get_value('index-text', type=Boolean,
-                                            default=True)
+        self.index_text = config.get_value('index-text')
+        self.text_queue = TextQueue('%s/text-queue' % target)
+        self.text_cache = None
+        size = config.get_value('text-cache-size')
+        if size:
+            self.text_cache = DiskCache('%s/cache/text' % target, size)
+        self.index_access = config.get_value('index-access')
+        self.access_queue = TextQueue('%s/access-queue' % target)
+        # Thumbnail cache
+        self.thumbnail_cache = None
+        size = config.get_value('thumbnail-cache-size')
+        if size:
+            self.thumbnail_cache = DiskCache('%s/cache/thumbnails' % target,
+                                             size)
+        # The resize pool (see icms-start.py)
+        self.resize_pool = None
+        # Page cache (anonymous users)
+        self.page_cache = None
+        size = config.get_value('page-cache-size')
+        if size:
+            self.page_cache = PageCache(size)
+            register_commit_listener(self.page_cache_listener)
+        self.index_workers = config.get_value('index-workers')
+        self.index_workers_threshold = config.get_value(
+            'index-workers-threshold')
 
         # Profile Memory
         if profile_space is True:
@@ -148,8 +344,22 @@ class Server(WebServer):
             size_min = size_max = cache_size
         size_min, size_max = int(size_min), int(size_max)
         read_only = read_only or config.get_value('database-readonly')
-        database = get_database(target, size_min, size_max, read_only)
+        read_only = read_only or replica
+        self.read_only = read_only
+        self.replica = replica
+        # The read-only workers (see icms-start.py)
+        self.workers = None
+        database = get_database(target, size_min, size_max, read_only,
+                                replica)
         self.database = database
+        # Group commit
+        self.group_commit_window = 0
+        if not read_only:
+            database.large_file_size = config.get_value('large-file-size')
+            self.group_commit_window = config.get_value('group-commit-window')
+            if self.group_commit_window:
+                database.group_commit_max = config.get_value(
+                    'group-commit-max')
 
         # Find out the root class
         root = get_root(database)
@@ -182,6 +392,11 @@ class Server(WebServer):
         register_logger(logger, None)
         logger = WebLogger(log_file, log_level)
         register_logger(logger, 'itools.web')
+        # Slow commits
+        self.slow_commit_threshold = get_value('slow-commit-threshold')
+        logger = Logger('%s/log/slow-commits' % target, WARNING,
+                        rotate=timedelta(weeks=3))
+        register_logger(logger, 'ikaaro.slow-commits')
 
         # Session timeout
         self.session_timeout = get_value('session-timeout')
@@ -331,6 +546,192 @@ class Server(WebServer):
         log_error(summary + details)
 
 
+    #######################################################################
+    # Deferred full-text indexing
+    #######################################################################
+    def index_text_queue(self, size=None):
+        """Index the full-text of the next resources in the queue, at most
+        'size' of them (by default all).  Return the number of resources
+        left in the queue.
+        """
+        queue = self.text_queue
+        paths = queue.get_paths()
+        if not paths:
+            return 0
+
+        rest = []
+        if size:
+            paths, rest = paths[:size], paths[size:]
+
+        # Build fake context
+        database = self.database
+        context = get_fake_context(database)
+        context.server = self
+        context.init_context()
+
+        # Reindex without committing
+        catalog = database.catalog
+        for path in paths:
+            resource = database.get_resource(path, soft=True)
+            if resource is None:
+                continue
+            text = resource.get_catalog_text()
+            if text is None:
+                continue
+            values = resource.get_catalog_values()
+            values['text'] = text
+            catalog.unindex_document(path)
+            catalog.index_document(values)
+            database.update_reverse_dependencies([values], [path])
+        database.save_catalog()
+        queue.set_paths(rest)
+
+        # Ok
+        log_info('Full-text indexed for %d resources, %d left' %
+                 (len(paths), len(rest)))
+        return len(rest)
+
+
+    def text_queue_manager(self):
+        size = self.config.get_value('index-text-batch')
+        left = self.index_text_queue(size)
+        # Go on with the next batch right away if there is something left
+        return 1 if left else 10
+
+
+    def index_access_queue(self, size=None):
+        """Reindex the next resources in the access queue (their
+        'readable_by' field), at most 'size' of them (by default all).
+        Return the number of resources left in the queue.
+        """
+        queue = self.access_queue
+        paths = queue.get_paths()
+        if not paths:
+            return 0
+
+        rest = []
+        if size:
+            paths, rest = paths[:size], paths[size:]
+
+        # Build fake context
+        database = self.database
+        context = get_fake_context(database)
+        context.server = self
+        context.init_context()
+
+        # Reindex without committing
+        catalog = database.catalog
+        for path in paths:
+            catalog.unindex_document(path)
+            resource = database.get_resource(path, soft=True)
+            if resource is None:
+                continue
+            values = resource.get_catalog_values()
+            catalog.index_document(values)
+            database.update_reverse_dependencies([values], [path])
+        database.save_catalog()
+        queue.set_paths(rest)
+        # The full-text is not in the values
+        if self.index_text == 'deferred':
+            self.text_queue.push(paths)
+
+        # Ok
+        log_info('Access reindexed for %d resources, %d left' %
+                 (len(paths), len(rest)))
+        return len(rest)
+
+
+    def access_queue_manager(self):
+        left = self.index_access_queue(100)
+        return 1 if left else 10
+
+
+    #######################################################################
+    # Database cache
+    #######################################################################
+    def cache_manager(self):
+        budget = self.config.get_value('database-memory-budget')
+        self.database.adapt_cache_size(budget)
+        return 60
+
+
+    #######################################################################
+    # Page cache
+    #######################################################################
+    def page_cache_listener(self, database, paths):
+        self.page_cache.invalidate(paths)
+
+
+    #######################################################################
+    # Resize pool
+    #######################################################################
+    def start_resize_pool(self):
+        get_value = self.config.get_value
+        pool = ResizePool(get_value('resize-workers'),
+                          get_value('resize-queue'),
+                          get_value('resize-timeout'))
+        pool.start()
+        self.resize_pool = pool
+
+
+    def resize_manager(self):
+        # Store the thumbnails made in the background
+        cache = self.thumbnail_cache
+        for key, (data, format) in self.resize_pool.collect():
+            set_thumbnail(cache, key, data, format)
+        return 1
+
+
+    #######################################################################
+    # Replica
+    #######################################################################
+    def replica_manager(self):
+        keys = self.database.sync()
+        if keys:
+            log_info('Replica synchronized, %d files changed' % len(keys))
+        return self.config.get_value('replica-interval')
+
+
+    #######################################################################
+    # Group commit
+    #######################################################################
+    def group_commit_manager(self):
+        self.database.flush_commits()
+        return True
+
+
+    def reindex_group_commit(self):
+        """Reindex the resources of a group commit that was not flushed,
+        committed by 'recover_group_commit' (see icms-start.py).
+        """
+        database = self.database
+        paths = database.read_group_commit_journal()
+        if not paths:
+            return
+
+        # Build fake context
+        context = get_fake_context(database)
+        context.server = self
+        context.init_context()
+
+        # Reindex
+        catalog = database.catalog
+        indexed = []
+        for path in paths:
+            catalog.unindex_document(path)
+            resource = database.get_resource(path, soft=True)
+            if resource is not None:
+                catalog.index_document(resource.get_catalog_values())
+                indexed.append(path)
+        catalog.save_changes()
+        database.reverse_dependencies.load(catalog)
+        # Deferred full-text indexing (as Database._save_changes)
+        if self.index_text == 'deferred':
+            self.text_queue.push(indexed)
+        log_warning('Group commit recovered, %d resources reindexed'
+                    % len(paths))
+
+
     #######################################################################
     # Time events
     #######################################################################
@@ -349,10 +750,16 @@ class Server(WebServer):
             resource = database.get_resource(brain.abspath)
             resource.time_event(payload)
             # Reindex resource without committing
+            path = str(resource.abspath)
+            values = resource.get_catalog_values()
             catalog = database.catalog
-            catalog.unindex_document(str(resource.abspath))
-            catalog.index_document(resource.get_catalog_values())
-            catalog.save_changes()
+            catalog.unindex_document(path)
+            catalog.index_document(values)
+            database.save_catalog()
+            database.update_reverse_dependencies([values], [path])
+            # Deferred full-text indexing (as Database._save_changes)
+            if self.index_text == 'deferred':
+                self.text_queue.push([path])
 
         # Save changes
         database.save_changes()
@@ -383,7 +790,23 @@ class ServerConfig(ConfigFile):
         # Tuning
         'database-size': String(default='19500:20500'),
         'database-readonly': Boolean(default=False),
-        'index-text': Boolean(default=True),
+        'database-memory-budget': DataSize(default=None),
+        'index-text': IndexTextValue(default=True),
+        'index-text-batch': Integer(default=50),
+        'index-access': Boolean(default=False),
+        'text-cache-size': DataSize(default=None),
+        'page-cache-size': DataSize(default=None),
+        'thumbnail-cache-size': DataSize(default=None),
+        'large-file-size': DataSize(default=10 * 1024 ** 2),
+        'resize-workers': Integer(default=0),
+        'resize-queue': Integer(default=20),
+        'resize-timeout': Integer(default=10000),
+        'slow-commit-threshold': Integer(default=1000),
+        'group-commit-window': Integer(default=0),
+        'group-commit-max': Integer(default=50),
+        'replica-interval': Integer(default=1),
+        'index-workers': Integer(default=0),
+        'index-workers-threshold': Integer(default=200),
         'max-width': Integer(default=None),
         'max-height': Integer(default=None),
     }
@@ -31,6 +31,7 @@ from itools.web import get_context, ERROR, INFO
 
 # Import from ikaaro
 from context import register_ui
+from database import register_commit_listener
 from folder import Folder
 from views import get_view_scripts
 from skins_views import LanguagesTemplate, LocationTemplate
@@ -51,6 +52,29 @@ class Skin(object):
         self.key = key
 
 
+    def get_fragment(self, context, name, build, config_only=False,
+                     key=()):
+        """Return the fragment of the page identified by the given name and
+        key, from the cache, or built by the given callable.
+
+        If 'config_only' is True the fragment depends only on the
+        configuration (it is dropped when /config changes), else it is
+        dropped by any commit.
+        """
+        user = context.user
+        user = str(user.abspath) if user else None
+        key = (self.key, name, user) + key
+        cache = config_fragments if config_only else fragments
+        if key in cache:
+            return cache[key]
+
+        value = build(context)
+        if len(cache) >= fragments_max:
+            cache.clear()
+        cache[key] = value
+        return value
+
+
     #######################################################################
     # HTML head
     #######################################################################
@@ -89,6 +113,11 @@ class Skin(object):
         return None
 
 
+    def _has_theme_file(self, context, name):
+        build = lambda context: self._get_theme_file(context, name) is not None
+        return self.get_fragment(context, 'theme-%s' % name, build, True)
+
+
     def get_styles(self, context):
         # Generic
         styles = ['/ui/bo.css']
@@ -106,7 +135,7 @@ class Skin(object):
         styles.extend(extra)
 
         # Database style
-        if self._get_theme_file(context, 'style'):
+        if self._has_theme_file(context, 'style'):
             styles.append(
                 '/config/theme/;get_file?name=style&mimetype=text/css')
 
@@ -166,7 +195,21 @@ class Skin(object):
                              'content': value})
 
         # Search engine optimization
-        seo = root.get_resource('config/seo')
+        meta.extend(self.get_fragment(context, 'seo', self._get_seo_meta_tags,
+                                      True))
+
+        # View
+        # meta are defined as a tuple (name, content, language)
+        extra_meta = getattr(context.view, 'meta', [])
+        for (name, content, lang) in extra_meta:
+            meta.append({'name': name, 'content': content, 'lang': lang})
+
+        return meta
+
+
+    def _get_seo_meta_tags(self, context):
+        meta = []
+        seo = context.root.get_resource('config/seo')
         for key, meta_name in [
             ('google_site_verification', 'google-site-verification'),
             ('yahoo_site_verification', 'y_key'),
@@ -176,17 +219,14 @@ class Skin(object):
                 meta.append({'name': meta_name,
                              'lang': None,
                              'content': verification_key})
-
-        # View
-        # meta are defined as a tuple (name, content, language)
-        extra_meta = getattr(context.view, 'meta', [])
-        for (name, content, lang) in extra_meta:
-            meta.append({'name': name, 'content': content, 'lang': lang})
-
         return meta
 
 
     def get_favicon(self, context):
+        return self.get_fragment(context, 'favicon', self._get_favicon, True)
+
+
+    def _get_favicon(self, context):
         # Case 1: from the database
         favicon = self._get_theme_file(context, 'favicon')
         if favicon:
@@ -209,6 +249,13 @@ class Skin(object):
     def get_usermenu(self, context):
         """Return a dict {'name': ..., 'title': ..., 'home': ...}
         """
+        here = context.resource
+        key = (str(here.abspath), context.get_link(here))
+        return self.get_fragment(context, 'usermenu', self._get_usermenu,
+                                 key=key)
+
+
+    def _get_usermenu(self, context):
         here = context.resource
         base_path = context.get_link(here)
 
@@ -325,15 +372,34 @@ class Skin(object):
 
 
     def get_footer(self, context):
+        language = self._get_language(context)
+        return self.get_fragment(context, 'footer', self._get_footer, True,
+                                 (language,))
+
+
+    def _get_footer(self, context):
         footer = context.root.get_resource('config/footer')
-        return footer.get_html_data()
+        data = footer.get_html_data()
+        return list(data) if data is not None else None
 
 
     def get_menu_namespace(self, context):
+        language = self._get_language(context)
+        key = (language, str(context.uri.path), context.view_name)
+        return self.get_fragment(context, 'menu', self._get_menu_namespace,
+                                 key=key)
+
+
+    def _get_menu_namespace(self, context):
         menu = context.root.get_resource('config/menu')
         return menu.get_menu_namespace(context)
 
 
+    def _get_language(self, context):
+        languages = context.root.get_value('website_languages')
+        return context.accept_language.select_language(languages)
+
+
     #######################################################################
     # Main
     #######################################################################
@@ -346,12 +412,11 @@ class Skin(object):
         favicon_href, favicon_type = self.get_favicon(context)
 
         # Logo
-        logo = self._get_theme_file(context, 'logo')
+        logo = self._has_theme_file(context, 'logo')
         logo_href = '/config/theme/;get_file?name=logo' if logo else None
 
         # The document language
-        languages = context.root.get_value('website_languages')
-        language = context.accept_language.select_language(languages)
+        language = self._get_language(context)
 
         # The base URI
         uri = context.uri
@@ -428,6 +493,27 @@ class Skin(object):
         return ''.join(s)
 
 
+###########################################################################
+# Cache of the fragments of the page (see Skin.get_fragment)
+###########################################################################
+# The fragments that depend only on the configuration
+config_fragments = {}
+# The other fragments, dropped by every commit
+fragments = {}
+# Maximum number of fragments kept by every cache
+fragments_max = 10000
+
+def _on_commit(database, paths):
+    fragments.clear()
+    for path in paths:
+        if path == '/config' or path.startswith('/config/'):
+            config_fragments.clear()
+            return
+
+register_commit_listener(_on_commit)
+
+
+
 ###########################################################################
 # Specific Skin for popup
 ###########################################################################
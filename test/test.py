@@ -18,10 +18,14 @@
 from unittest import TestLoader, TestSuite, TextTestRunner
 
 # Import tests
+import test_cache
+import test_config_access
+import test_database
 import test_metadata
 
 
-test_modules = [test_metadata]
+test_modules = [test_cache, test_config_access, test_database,
+                test_metadata]
 
 
 loader = TestLoader()
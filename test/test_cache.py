@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2012 Sylvain Taverne <sylvain@itaapy.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, main
+
+# Import from ikaaro
+from ikaaro.cache import DiskCache, PageCache
+
+
+class DiskCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.path = mkdtemp()
+        self.cache = DiskCache('%s/cache' % self.path, 10)
+
+
+    def tearDown(self):
+        rmtree(self.path)
+
+
+    def test_get(self):
+        cache = self.cache
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', '1234')
+        self.assertEqual(cache.get('a'), '1234')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+    def test_lru(self):
+        cache = self.cache
+        cache.set('a', '1234')
+        cache.set('b', '1234')
+        cache.get('a')
+        cache.set('c', '1234')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), '1234')
+        self.assertEqual(cache.evictions, 1)
+
+
+    def test_reload(self):
+        self.cache.set('a', '1234')
+        cache = DiskCache('%s/cache' % self.path, 10)
+        self.assertEqual(cache.get('a'), '1234')
+        self.assertEqual(cache.total, 4)
+
+
+    def test_shared(self):
+        # Another process writes to the same folder
+        other = DiskCache('%s/cache' % self.path, 10)
+        self.cache.set('a', '1234')
+        other.set('b', '1234')
+        self.cache.set('c', '1234')
+        self.assertEqual(other.get('a'), None)
+        self.assertEqual(other.get('b'), '1234')
+        self.assertEqual(self.cache.get_stats()['size'], 8)
+
+
+
+class PageCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.cache = PageCache(10)
+
+
+    def test_lru(self):
+        cache = self.cache
+        cache.set('a', '/a', 'text/html', '1234')
+        cache.set('b', '/b', 'text/html', '1234')
+        cache.get('a')
+        cache.set('c', '/c', 'text/html', '1234')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), ('text/html', '1234'))
+        self.assertEqual(cache.total, 8)
+
+
+    def test_invalidate(self):
+        cache = self.cache
+        cache.set('a', '/a', 'text/html', '1')
+        cache.set('ab', '/a/b', 'text/html', '1')
+        cache.set('ac', '/a/c', 'text/html', '1')
+        cache.set('ab2', '/ab', 'text/html', '1')
+        cache.invalidate(['/a/b'])
+        self.assertEqual(sorted(cache.entries), ['ab2', 'ac'])
+        cache.invalidate(['/config/theme'])
+        self.assertEqual(len(cache.entries), 0)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2012 Sylvain Taverne <sylvain@itaapy.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from unittest import TestCase, main
+
+# Import from itools
+from itools.database import AllQuery
+
+# Import from ikaaro
+from ikaaro.config_access import get_rules_query, simplify_rules
+
+
+class SimplifyRulesTestCase(TestCase):
+    """The rules are the tuples (path, depth, format) returned by
+    AccessRule.get_search_key
+    """
+
+    def test_parent_path(self):
+        rules = [('/a/b', 0, None), ('/a', None, None),
+                 ('/a/b/c', None, 'file')]
+        self.assertEqual(simplify_rules(rules), [('/a', None, None)])
+
+
+    def test_parent_path_depth(self):
+        # The parent rule has a limited depth, it does not cover the other
+        rules = [('/a', 1, None), ('/a/b/c', None, None)]
+        self.assertEqual(simplify_rules(rules), rules)
+
+
+    def test_parent_path_format(self):
+        rules = [('/a', None, 'file'), ('/a/b', None, 'webpage'),
+                 ('/a/c', 0, 'file')]
+        self.assertEqual(simplify_rules(rules),
+                         [('/a', None, 'file'), ('/a/b', None, 'webpage')])
+
+
+    def test_duplicates(self):
+        rules = [('/a', 0, 'file'), ('/b', 1, None), ('/a', 0, 'file')]
+        self.assertEqual(simplify_rules(rules),
+                         [('/a', 0, 'file'), ('/b', 1, None)])
+
+
+    def test_no_path(self):
+        # A rule without path applies to everything (of the format)
+        rules = [('/', None, 'file'), ('/a', 0, 'file'), ('/b', 0, None)]
+        self.assertEqual(simplify_rules(rules),
+                         [('/', None, 'file'), ('/b', 0, None)])
+        rules = [('/', None, None), ('/a', 0, 'file')]
+        self.assertEqual(simplify_rules(rules), [('/', None, None)])
+
+
+    def test_different_path(self):
+        # '/ab' is not within '/a'
+        rules = [('/a', None, None), ('/ab', None, None), ('/b/c', 0, None)]
+        self.assertEqual(simplify_rules(rules), rules)
+
+
+
+class RulesQueryTestCase(TestCase):
+
+    def test_everything(self):
+        query = get_rules_query([('/a', 0, None), ('/', None, None)])
+        self.assertTrue(isinstance(query, AllQuery))
+
+
+    def test_simplified(self):
+        rules = [('/a', None, None), ('/a/b', 0, 'file'), ('/a', None, None),
+                 ('/ab', None, None)]
+        query = get_rules_query(rules)
+        self.assertEqual(len(query.atoms), 2)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2012 Sylvain Taverne <sylvain@itaapy.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import from the Standard Library
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, main
+
+# Import from itools
+from itools.database import Metadata, PhraseQuery
+
+# Import from ikaaro
+from ikaaro.database import ReplicaDatabase, ReverseDependencies
+from ikaaro.database import make_database
+from ikaaro.root import Root
+from ikaaro.server import get_fake_context, get_root
+
+
+class Brain(object):
+
+    def __init__(self, abspath):
+        self.abspath = abspath
+
+
+
+class SearchResults(object):
+
+    def __init__(self, paths):
+        self.paths = paths
+
+
+    def get_documents(self):
+        return [ Brain(x) for x in self.paths ]
+
+
+
+class Catalog(object):
+    """Enough of the catalog for ReverseDependencies.load: it keeps the
+    'onchange_reindex' values of every path.
+    """
+
+    def __init__(self, values):
+        self.values = values
+
+
+    def get_unique_values(self, name):
+        return set([ y for x in self.values.values() for y in x ])
+
+
+    def search(self, query):
+        return SearchResults([ x for x, y in self.values.items()
+                               if query.value in y ])
+
+
+
+class ReverseDependenciesTestCase(TestCase):
+
+    def setUp(self):
+        # Comments depend on the page they are attached to
+        dependencies = ReverseDependencies()
+        dependencies.add('/page/comments/0', ['/page'])
+        dependencies.add('/page/comments/1', ['/page'])
+        dependencies.add('/page/comments/1/reply', '/page/comments/1')
+        self.dependencies = dependencies
+
+
+    def test_dependents(self):
+        to_reindex = self.dependencies.get_dependents(['/page'])
+        self.assertEqual(to_reindex, set(['/page/comments/0',
+                                          '/page/comments/1',
+                                          '/page/comments/1/reply']))
+
+
+    def test_no_dependents(self):
+        to_reindex = self.dependencies.get_dependents(['/page/comments/0'])
+        self.assertEqual(to_reindex, set())
+
+
+    def test_change(self):
+        self.dependencies.add('/page/comments/1', ['/other'])
+        to_reindex = self.dependencies.get_dependents(['/page'])
+        self.assertEqual(to_reindex, set(['/page/comments/0']))
+        to_reindex = self.dependencies.get_dependents(['/other'])
+        self.assertEqual(to_reindex, set(['/page/comments/1',
+                                          '/page/comments/1/reply']))
+
+
+    def test_remove(self):
+        self.dependencies.remove('/page/comments/0')
+        self.dependencies.remove('/page/comments/1')
+        to_reindex = self.dependencies.get_dependents(['/page'])
+        self.assertEqual(to_reindex, set())
+        self.assertEqual(self.dependencies.dependents.keys(),
+                         ['/page/comments/1'])
+
+
+    def test_check(self):
+        catalog = Catalog({'/page/comments/0': ['/page'],
+                           '/page/comments/1': ['/page'],
+                           '/page/comments/1/reply': ['/page/comments/1']})
+        self.assertEqual(self.dependencies.check(catalog), [])
+
+        # The relation in memory and the catalog differ
+        self.dependencies.remove('/page/comments/0')
+        self.dependencies.add('/page/comments/2', ['/page'])
+        self.assertEqual(self.dependencies.check(catalog),
+                         ['/page/comments/0', '/page/comments/2'])
+
+
+    def test_cycle(self):
+        self.dependencies.add('/page', ['/page/comments/1/reply'])
+        to_reindex = self.dependencies.get_dependents(['/page'])
+        self.assertEqual(to_reindex, set(['/page',
+                                          '/page/comments/0',
+                                          '/page/comments/1',
+                                          '/page/comments/1/reply']))
+
+
+
+class ReplicaTestCase(TestCase):
+
+    def setUp(self):
+        # The instance, as made by icms-init
+        self.target = mkdtemp()
+        database = make_database(self.target)
+        context = get_fake_context(database)
+        context.set_mtime = True
+        metadata = Metadata(cls=Root)
+        database.set_handler('.metadata', metadata)
+        root = Root(metadata)
+        root.init_resource('test@example.com', 'password')
+        context.root = root
+        context.git_message = 'Initial commit'
+        database.save_changes()
+        self.database = database
+        self.root = root
+
+
+    def tearDown(self):
+        rmtree(self.target)
+
+
+    def test_sync(self):
+        replica = ReplicaDatabase(self.target, 19500, 20500)
+        self.assertEqual(replica.sync(), [])
+        # Load the root in the replica, so it is in its cache
+        title = get_root(replica).get_value('title', language='en')
+        self.assertNotEqual(title, u'Hello')
+
+        # Change it in the master
+        self.root.set_value('title', u'Hello', language='en')
+        self.database.save_changes()
+
+        keys = replica.sync()
+        self.assertTrue('.metadata' in keys)
+        title = get_root(replica).get_value('title', language='en')
+        self.assertEqual(title, u'Hello')
+
+
+    def test_sync_catalog(self):
+        replica = ReplicaDatabase(self.target, 19500, 20500)
+        query = PhraseQuery('abspath', '/')
+        self.assertEqual(len(replica.catalog.search(query)), 1)
+
+        # The catalog is saved without a commit (e.g. deferred full-text)
+        catalog = self.database.catalog
+        catalog.unindex_document('/')
+        catalog.save_changes()
+
+        self.assertEqual(replica.sync(), [])
+        self.assertEqual(len(replica.catalog.search(query)), 0)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+/* Gallery (Folder_PreviewContent): when the bottom of the page is near, load
+ * the next page (in JSON) and add its images. */
+$(document).ready(function() {
+  var gallery = $('#browse-image');
+  var next = gallery.attr('data-next');
+  if (!next)
+    return;
+
+  // The batch control is replaced by the scroll
+  $('.batchcontrol, .batch-pages').hide();
+
+  var size = gallery.attr('data-size');
+  var checkbox = gallery.find('input.checkbox').length > 0;
+  var loading = false;
+
+  function make_thumbnail(image) {
+    var img = $('<img/>').attr('src', image.thumb);
+    if (image.width && image.height)
+      img.attr('title', image.width + ' × ' + image.height);
+    if (image.href)
+      img = $('<a/>').attr('href', image.href).append(img);
+    if (image.is_folder)
+      img = $('<div class="folder"/>').append(img);
+
+    var p = $('<p/>');
+    if (checkbox) {
+      p.append($('<input type="checkbox" name="ids" class="checkbox"/>')
+        .attr('id', 'id-' + image.name).attr('value', image.name));
+    } else {
+      p.append($('<label/>').text(image.title));
+    }
+
+    return $('<div/>').addClass('thumbnail size' + size).append(img, p);
+  }
+
+  function load() {
+    if (loading || !next)
+      return;
+    var bottom = $(window).scrollTop() + $(window).height();
+    if (bottom < $(document).height() - 400)
+      return;
+
+    loading = true;
+    $.getJSON(next, function(data) {
+      $.each(data.images, function(i, image) {
+        gallery.append(make_thumbnail(image));
+      });
+      next = data.next;
+      loading = false;
+      // Fill the screen
+      load();
+    }).fail(function() {
+      // Try again with the next scroll
+      loading = false;
+    });
+  }
+
+  $(window).scroll(load);
+  load();
+});
@@ -34,9 +34,12 @@ from itools.handlers import checkid
 from itools.html import HTMLParser, stream_to_str_as_xhtml
 from itools.stl import STLTemplate, stl_namespaces
 from itools.uri import get_reference, Reference
-from itools.web import get_context
+from itools.web import NotModified, get_context
 from itools.xml import XMLParser
 
+# Import from ikaaro
+from cache import get_blob_id
+
 
 ###########################################################################
 # CMS Template
@@ -296,11 +299,10 @@ def get_content_containers(context, class_id=None):
         PhraseQuery('base_classes', 'folder'),
         PhraseQuery('is_content', True))
 
-    root = context.root
-    for container in context.search(query).get_resources():
-        if not root.has_permission(context.user, 'add', container, class_id):
-            continue
-
+    containers = list(context.search(query).get_resources())
+    containers = context.root.has_permissions(context.user, 'add', containers,
+                                              class_id)
+    for container in containers:
         if class_id is None:
             yield container
             continue
@@ -366,3 +368,152 @@ def close_fancybox(context, default=None):
     # Case 2: normal
     goto = context.get_form_value('referrer') or default
     return get_reference(goto) if type(goto) is str else goto
+
+
+
+###########################################################################
+# HTTP cache
+###########################################################################
+def get_etag(*values):
+    """Returns an entity tag made from the given values, which must identify
+    the version of the content.
+    """
+    data = ':'.join([ str(x) for x in values ])
+    return '"%s"' % sha1(data).hexdigest()
+
+
+
+def check_etag(context, etag, mtime):
+    """To be called by the 'get_mtime' method of the views (itools calls it
+    before GET, to check the If-Modified-Since header and set Last-Modified).
+
+    Sets the ETag header and raises NotModified if the client has this
+    version already.  The If-None-Match header takes precedence over
+    If-Modified-Since, so the modification time is returned only if there is
+    no If-None-Match header.
+    """
+    context.set_header('ETag', etag)
+    if_none_match = context.get_header('If-None-Match')
+    if not if_none_match:
+        return mtime
+
+    etags = [ x.strip() for x in if_none_match.split(',') ]
+    if '*' in etags or etag in etags or 'W/%s' % etag in etags:
+        raise NotModified
+    return None
+
+
+
+def set_cache_control(context, resource, max_age=0, per_user=False):
+    """Sets the Cache-Control header: shared caches (a reverse proxy) may
+    keep the content only if anonymous users can see it, and, if it depends
+    on the user ('per_user'), only when it is served to anonymous users.
+    With a max-age of zero the clients revalidate every time, with the ETag.
+    """
+    root = context.root
+    if per_user:
+        # The anonymous version must not be served to the users either
+        context.set_header('Vary', 'Cookie')
+    if per_user and context.user:
+        cache = 'private'
+    elif root.is_allowed_to_view(None, resource):
+        cache = 'public'
+    else:
+        cache = 'private'
+    value = '%s, max-age=%d, must-revalidate' % (cache, max_age)
+    context.set_header('Cache-Control', value)
+
+
+
+###########################################################################
+# Images
+###########################################################################
+def get_image_sizes(context, items):
+    """Returns a dict {abspath: (width, height)} with the size of the given
+    images, read from the catalog (so the images are not loaded).
+    """
+    query = [ PhraseQuery('abspath', str(x.abspath)) for x in items ]
+    if not query:
+        return {}
+
+    sizes = {}
+    results = context.database.search(OrQuery(*query))
+    for brain in results.get_documents():
+        width = getattr(brain, 'image_width', None)
+        height = getattr(brain, 'image_height', None)
+        if width is not None and height is not None:
+            sizes[brain.abspath] = (width, height)
+    return sizes
+
+
+
+###########################################################################
+# Thumbnails
+###########################################################################
+blob_ids = {}
+blob_ids_max = 10000
+
+def get_handler_blob_id(handler):
+    """Returns the blob id of the data of the given handler.  For the handlers
+    saved in the database it is computed once per version of the file.
+    """
+    key = handler.key
+    if handler.dirty is not None or key is None:
+        return get_blob_id(handler.to_str())
+
+    key = (key, handler.get_mtime())
+    blob_id = blob_ids.get(key)
+    if blob_id is None:
+        if len(blob_ids) >= blob_ids_max:
+            blob_ids.clear()
+        blob_id = blob_ids[key] = get_blob_id(handler.to_str())
+    return blob_id
+
+
+
+def get_thumbnail(handler, width, height, format='jpeg', fit=False,
+                  wait=True, blob_id=None):
+    """Same as 'handler.get_thumbnail', but uses the thumbnail cache if there
+    is one (see the 'thumbnail-cache-size' option), and the resize pool if
+    there is one (see 'resize-workers').
+
+    With the resize pool (it requires the cache), ResizeBusy is raised if
+    the pool is saturated or the thumbnail is not made yet; it is made in
+    the background, collected by the resize manager and stored in the cache.
+    If 'wait' is False the thumbnail is only queued, and None is returned.
+    The 'blob_id' of the handler may be given, when it is known already.
+    """
+    server = get_context().server
+    cache = getattr(server, 'thumbnail_cache', None)
+    pool = getattr(server, 'resize_pool', None)
+
+    # Cache
+    key = None
+    if cache is not None:
+        if blob_id is None:
+            blob_id = get_handler_blob_id(handler)
+        key = '%s:%s:%s:%d:%s' % (blob_id, width, height, fit, format)
+        value = cache.get(key)
+        if value is not None:
+            format, data = value.split('\n', 1)
+            return data, format
+
+    # Resize
+    if pool is None or key is None:
+        data, format = handler.get_thumbnail(width, height, format, fit)
+    elif wait is False:
+        pool.submit(key, handler, width, height, format, fit)
+        return None
+    else:
+        data, format = pool.get_thumbnail(key, handler, width, height,
+                                          format, fit)
+
+    if cache is not None:
+        set_thumbnail(cache, key, data, format)
+    return data, format
+
+
+
+def set_thumbnail(cache, key, data, format):
+    if data is not None:
+        cache.set(key, '%s\n%s' % (format, data))